@@ -0,0 +1,279 @@
+"""
+Admission Module
+
+Caps how much work the API accepts at once. Each group of routes has an
+AdmissionController with a concurrency limit and a bounded wait queue:
+
+- a request that finds a free slot runs at once;
+- otherwise it waits in the queue, first come first served, for up to
+  ADMISSION_MAX_WAIT seconds;
+- a request that finds the queue full is rejected with 429, and one that
+  waits too long with 503, both with a Retry-After estimated from recent
+  service times.
+
+Requests are admitted by AdmissionMiddleware before their body is read,
+so a rejected upload costs almost nothing, and their slot is held until
+the response (streamed or not) has been sent. Background jobs take a slot
+of the same controllers while they run (see AdmissionController.slot), so
+submitting work through /jobs does not get around the limits; having no
+client to answer with 429, they wait and queue again instead.
+
+Limits are per uvicorn worker process.
+
+Configuration (environment):
+    ADMISSION_CPU_LIMIT     Concurrent CPU-heavy requests (/process-invoice,
+                            /extract-only); default 2 × EXECUTOR_WORKERS.
+    ADMISSION_CPU_QUEUE     Requests waiting for them (default 8 ×
+                            EXECUTOR_WORKERS).
+    ADMISSION_BATCH_LIMIT   Concurrent batch requests (/process-invoices,
+                            /process-invoices-from-api); default 2.
+    ADMISSION_BATCH_QUEUE   Batch requests waiting (default 4).
+    ADMISSION_MAX_WAIT      Longest wait in a queue, in seconds (default 30).
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+from fastapi.responses import JSONResponse
+
+from metrics import admission_wait_seconds
+from workers import EXECUTOR_WORKERS
+
+
+ADMISSION_CPU_LIMIT = int(os.getenv("ADMISSION_CPU_LIMIT", str(2 * EXECUTOR_WORKERS)))
+ADMISSION_CPU_QUEUE = int(os.getenv("ADMISSION_CPU_QUEUE", str(8 * EXECUTOR_WORKERS)))
+ADMISSION_BATCH_LIMIT = int(os.getenv("ADMISSION_BATCH_LIMIT", "2"))
+ADMISSION_BATCH_QUEUE = int(os.getenv("ADMISSION_BATCH_QUEUE", "4"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+
+# Bounds for the Retry-After header, in seconds
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 120
+
+# Waits remembered for the rolling wait-time figures
+STATS_WINDOW_SECONDS = 60.0
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is not admitted.
+
+    Attributes:
+        status_code (int): 429 (queue full) or 503 (waited too long).
+        detail (str): The error message.
+        retry_after (int): Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded FIFO wait queue.
+
+    acquire() and release() must be called from the event loop; stats()
+    may be called from any thread.
+
+    Args:
+        name (str): Used in error messages and as the metrics label.
+        limit (int): Requests running at once.
+        queue_size (int): Requests allowed to wait; 0 rejects as soon as
+            every slot is taken.
+        max_wait (float): Longest wait in the queue, in seconds.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait: float = ADMISSION_MAX_WAIT):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.max_wait = max_wait
+
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._recent_waits = deque()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.avg_service_seconds = 0.0
+
+    def _retry_after(self) -> int:
+        # Time for everyone ahead to be served, assuming recent service times
+        estimate = self.avg_service_seconds * (len(self._waiters) + 1) / self.limit
+        return int(min(max(math.ceil(estimate), MIN_RETRY_AFTER), MAX_RETRY_AFTER))
+
+    def _record_wait(self, seconds: float):
+        admission_wait_seconds.observe(seconds, self.name)
+        now = time.monotonic()
+        with self._lock:
+            self.admitted += 1
+            self._recent_waits.append((now, seconds))
+            self._trim(now)
+
+    def _trim(self, now: float):
+        while self._recent_waits and now - self._recent_waits[0][0] > STATS_WINDOW_SECONDS:
+            self._recent_waits.popleft()
+
+    async def acquire(self):
+        """
+        Take a slot, waiting in the queue if necessary.
+
+        Raises:
+            Overloaded: 429 if the queue is full, 503 if no slot freed up
+                within max_wait.
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self._record_wait(0.0)
+            return
+
+        if len(self._waiters) >= self.queue_size:
+            with self._lock:
+                self.rejected_queue_full += 1
+            raise Overloaded(
+                429, f"Too many {self.name} requests in progress; try again later.", self._retry_after()
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            # release() hands its slot straight to the waiter, so in_flight
+            # is already counted when this returns
+            await asyncio.wait_for(waiter, self.max_wait)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # A slot arrived just as we gave up; pass it on
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                with self._lock:
+                    self.rejected_timeout += 1
+                raise Overloaded(
+                    503, f"Timed out after {self.max_wait:g}s waiting for a {self.name} slot; try again later.",
+                    self._retry_after()
+                )
+            raise
+        self._record_wait(time.monotonic() - start)
+
+    def release(self, service_seconds: float = None):
+        """
+        Free a slot, handing it to the longest-waiting request if any.
+
+        Args:
+            service_seconds (float, optional): How long the request held
+                its slot; feeds the Retry-After estimate.
+        """
+        if service_seconds is not None:
+            # Exponential moving average, weighted towards recent requests
+            self.avg_service_seconds += 0.2 * (service_seconds - self.avg_service_seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, retry: bool = False) -> AsyncIterator[None]:
+        """
+        Hold a slot for the body of an ``async with`` block.
+
+        Args:
+            retry (bool): On Overloaded, sleep for its retry_after and queue
+                again instead of raising; for background work, which has
+                no client to reject.
+
+        Raises:
+            Overloaded: Without *retry*, as acquire().
+        """
+        while True:
+            try:
+                await self.acquire()
+                break
+            except Overloaded as e:
+                if not retry:
+                    raise
+                await asyncio.sleep(e.retry_after)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> dict:
+        """
+        Return the current figures.
+
+        Returns:
+            dict: limit, in_flight, queue_size, queued (current queue depth),
+            admitted, rejected_queue_full, rejected_timeout, the average
+            and maximum wait in milliseconds over the last
+            STATS_WINDOW_SECONDS, and the average time a slot is held.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            waits = [seconds for _, seconds in self._recent_waits]
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queue_size": self.queue_size,
+                "queued": len(self._waiters),
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_timeout": self.rejected_timeout,
+                "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "max_wait_ms": round(max(waits) * 1000, 2) if waits else 0.0,
+                "avg_service_ms": round(self.avg_service_seconds * 1000, 2),
+            }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting POST requests to the paths in *routes*
+    through their AdmissionController.
+
+    Args:
+        app: The ASGI application.
+        routes (dict): Request path → AdmissionController.
+    """
+
+    def __init__(self, app, routes: Dict[str, AdmissionController]):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        controller = None
+        if scope["type"] == "http" and scope["method"] == "POST":
+            controller = self.routes.get(scope["path"])
+        if controller is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await controller.acquire()
+        except Overloaded as e:
+            response = JSONResponse(
+                status_code=e.status_code,
+                content={"detail": e.detail},
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(time.monotonic() - start)
@@ -5,16 +5,14 @@ Gemini Client Module
 This module provides a client interface for the Google Gemini API to extract
 structured data from invoice images using AI-powered OCR and data extraction.
 """
+import os
+
 from dotenv import load_dotenv
-load_dotenv()
 
-import os
 
-try:
-    from google import genai
-    from google.genai import types
-except ImportError:
-    raise ImportError("Please run `pip install google-genai` package to use the Gemini client.")
+# Bump whenever the extraction prompt or response parsing changes; cached
+# results are keyed by it and the model name (see result_cache)
+PROMPT_VERSION = "1"
 
 
 class GeminiClient:
@@ -27,21 +25,30 @@ class GeminiClient:
         client (genai.Client): The initialized Gemini API client.
     """
     
-    def __init__(self, api_key: str = os.getenv("GEMINI_API_KEY"),
-                 model_name: str = os.getenv("MODEL_NAME")):
+    def __init__(self, api_key: str = None, model_name: str = None):
         """
         Initialize the Gemini client with API credentials and model configuration.
         
         Args:
-            api_key (str): The API key for Gemini API authentication.
-            model_name (str): The Gemini model name to use for content generation.
+            api_key (str, optional): The API key for Gemini API authentication.
+                Defaults to GEMINI_API_KEY from the environment or .env.
+            model_name (str, optional): The Gemini model name to use for content
+                generation. Defaults to MODEL_NAME from the environment or .env.
         
         Raises:
             ImportError: If the API key is not configured properly.
         """
-        self.api_key = api_key
-        self.model_name = model_name
-        
+        # Read here, not at import: .env may not have been loaded by then
+        load_dotenv()
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        self.model_name = model_name or os.getenv("MODEL_NAME")
+
+        # Imported here: google.genai takes most of a second to import
+        try:
+            from google import genai
+        except ImportError:
+            raise ImportError("Please run `pip install google-genai` package to use the Gemini client.")
+
         try:
             self.client = genai.Client(api_key=self.api_key)
         except Exception:
@@ -292,13 +299,14 @@ If there are any key objects that are missing, do NOT omit them. Instead return
         
         return prompt
     
-    def call_llm(self, prompt: str, image_path: str, response_schema: dict):
+    def call_llm(self, prompt: str, image_path: "str | bytes", response_schema: dict):
         """
         Make an API call to the Gemini model with the provided image and prompt.
         
         Args:
             prompt (str): The extraction prompt with instructions for the model.
-            image_path (str): Path to the invoice image file.
+            image_path (str | bytes): Path to the invoice image file, or the
+                JPEG-encoded image itself when it is already in memory.
             response_schema (dict): JSON schema defining the expected response structure.
         
         Returns:
@@ -308,14 +316,19 @@ If there are any key objects that are missing, do NOT omit them. Instead return
             ImportError: If the image path is invalid or not provided.
         """
         try:
-            with open(image_path, 'rb') as f:
-                image_bytes = f.read()
+            if isinstance(image_path, bytes):
+                image_bytes = image_path
+            else:
+                with open(image_path, 'rb') as f:
+                    image_bytes = f.read()
         except Exception:
             if image_path is not None:
                 raise ImportError("Image path provided is invalid.")
             else:
                 raise ImportError("Image path not provided.")
 
+        from google.genai import types
+
         response = self.client.models.generate_content(
             model=self.model_name,
             contents=[
@@ -338,7 +351,7 @@ If a value is missing, return an empty string "".""",
 
         return response
 
-    def extract_invoice_data(self, image_path: str) -> dict:
+    def extract_invoice_data(self, image_path: "str | bytes") -> dict:
         """
         Extract structured data from an invoice image using the Gemini API.
         
@@ -346,7 +359,8 @@ If a value is missing, return an empty string "".""",
         It loads the image, applies the extraction prompt, and returns parsed JSON data.
         
         Args:
-            image_path (str): Path to the invoice image file to process.
+            image_path (str | bytes): Path to the invoice image file to process,
+                or the JPEG-encoded image bytes.
         
         Returns:
             dict: Parsed JSON response containing all extracted invoice data fields.
@@ -5,24 +5,43 @@ This module provides utility functions for invoice data processing,
 including number-to-words conversion and value validation.
 """
 
-try:
-    from num2words import num2words
-except ImportError:
-    raise ImportError("Please install num2words: pip install num2words")
-
-try:
-    from pdf2image import convert_from_path
-except ImportError:
-    raise ImportError("Please install pdf2image: pip install pdf2image")
-
-import numpy as np
-from PIL import Image
+import fitz  # PyMuPDF
 from pathlib import Path
 
-import json
+import hashlib
+import importlib
 import os
-import requests
-from datetime import datetime, timezone
+import time
+from typing import TYPE_CHECKING
+
+from http_client import get_session, DEFAULT_TIMEOUT
+from processed_log import get_processed_log
+
+# Heavy dependencies are imported on first use rather than with this
+# module, so the CLI and short-lived processes only pay for what they use.
+# Long-lived server workers load them up front with warm_up().
+LAZY_MODULES = ("numpy", "num2words", "requests", "urllib3.util.retry")
+
+if TYPE_CHECKING:
+    import numpy
+
+
+def warm_up(modules=LAZY_MODULES) -> float:
+    """
+    Import *modules* now instead of on first use.
+
+    Args:
+        modules (tuple): Module names; defaults to this module's lazily
+            imported dependencies.
+
+    Returns:
+        float: Seconds spent importing.
+    """
+    start = time.perf_counter()
+    for name in modules:
+        importlib.import_module(name)
+    return time.perf_counter() - start
+
 
 def number_to_words_inr(amount: float) -> str:
     """
@@ -46,6 +65,11 @@ def number_to_words_inr(amount: float) -> str:
         >>> number_to_words_inr(5000.00)
         'Rupees Five Thousand and Paisa Only.'
     """
+    try:
+        from num2words import num2words
+    except ImportError:
+        raise ImportError("Please install num2words: pip install num2words")
+
     rupees = int(amount)
     paise = int(round((amount - rupees) * 100))
 
@@ -114,6 +138,67 @@ def is_value_present(value) -> bool:
     return True
 
 
+def render_page(page: "fitz.Page", dpi: int = 200, grayscale: bool = False) -> "fitz.Pixmap":
+    """
+    Render a single PDF page to a PyMuPDF pixmap, in-process.
+
+    Args:
+        page (fitz.Page): The page to render.
+        dpi (int): Rendering resolution in dots-per-inch (default: 200).
+        grayscale (bool): Render a single 8-bit gray channel instead of RGB
+            (default: False).
+
+    Returns:
+        fitz.Pixmap: The rendered page without an alpha channel.
+    """
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    return page.get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False)
+
+
+def pixmap_to_array(pix: "fitz.Pixmap") -> "numpy.ndarray":
+    """
+    Expose a pixmap's sample buffer as a NumPy array without copying.
+
+    The array is a ``uint8`` view of shape ``(height, width, n)`` over the
+    pixmap's own memory. It is only valid while *pix* is alive, so keep a
+    reference to the pixmap for as long as the array is in use.
+
+    Args:
+        pix (fitz.Pixmap): A pixmap, typically from ``render_page``.
+
+    Returns:
+        numpy.ndarray: Read-only view of the pixel data.
+    """
+    import numpy as np
+
+    samples = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    return np.lib.stride_tricks.as_strided(
+        samples,
+        shape=(pix.height, pix.width, pix.n),
+        strides=(pix.stride, pix.n, 1),
+        writeable=False,
+    )
+
+
+def pixmap_to_pil(pix: "fitz.Pixmap"):
+    """
+    Convert a pixmap into a PIL image, for callers that need one.
+
+    The pixel data is copied once so that the returned image does not depend
+    on the lifetime of *pix*.
+
+    Args:
+        pix (fitz.Pixmap): A pixmap, typically from ``render_page``.
+
+    Returns:
+        PIL.Image.Image: An ``L``, ``RGB`` or ``RGBA`` image.
+    """
+    from PIL import Image
+
+    mode = {1: "L", 3: "RGB", 4: "RGBA"}[pix.n]
+    return Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+
+
 def pdf_to_png_images(
     pdf_path: str,
     dpi: int = 200,
@@ -122,6 +207,9 @@ def pdf_to_png_images(
     """
     Convert every page of a PDF file into a PNG image.
 
+    Pages are rendered in-process with PyMuPDF; no external Poppler binaries
+    are involved.
+
     Args:
         pdf_path (str): Path to the source PDF file.
         dpi (int): Rendering resolution in dots-per-inch (default: 200).
@@ -138,7 +226,6 @@ def pdf_to_png_images(
 
     Raises:
         FileNotFoundError: If *pdf_path* does not point to an existing file.
-        ImportError: If ``pdf2image`` is not installed or Poppler is missing.
 
     Examples:
         >>> images = pdf_to_png_images("document.pdf")
@@ -151,36 +238,102 @@ def pdf_to_png_images(
     if not pdf_path.exists():
         raise FileNotFoundError(f"PDF file not found: {pdf_path}")
 
-    images = convert_from_path(str(pdf_path), dpi=dpi, fmt="png")
-
+    out = None
     if output_dir is not None:
         out = Path(output_dir)
         out.mkdir(parents=True, exist_ok=True)
-        for idx, img in enumerate(images, start=1):
-            img.save(out / f"page_{idx}.png", format="PNG")
+
+    images = []
+    with fitz.open(str(pdf_path)) as doc:
+        for idx, page in enumerate(doc, start=1):
+            pix = render_page(page, dpi=dpi)
+            if out is not None:
+                pix.save(str(out / f"page_{idx}.png"))
+            images.append(pixmap_to_pil(pix))
 
     return images
 
 
+BLANK_CHECK_DPI = 36
+
+
+def is_page_blank(
+    page: "fitz.Page",
+    dpi: int = BLANK_CHECK_DPI,
+    brightness_threshold: float = 253.0,
+    white_pixel_ratio: float = 0.999,
+    text: str | None = None,
+    images: list | None = None,
+) -> bool:
+    """
+    Detect whether a single, already-loaded PDF page is blank.
+
+    Detection is tiered so that rendering is the exception, not the rule:
+
+        1. Any extractable text means the page has content.
+        2. No text, no vector drawings and no images means the page is blank.
+        3. Only when the page carries drawings or images but no text is the
+           answer ambiguous (e.g. a white background rectangle). The page is
+           then rendered once as an 8-bit grayscale pixmap at a very low
+           resolution and thresholded.
+
+    Args:
+        page (fitz.Page): The page to inspect.
+        dpi (int): Resolution of the fallback render (default: 36).
+        brightness_threshold (float): Minimum gray value (0-255) for a
+            pixel to be counted as white (default: 253).
+        white_pixel_ratio (float): Fraction of pixels that must be white for
+            the page to be classified as blank (default: 0.999).
+        text (str | None): The page text, when the caller already has it.
+        images (list | None): The page image list, when the caller already
+            has it.
+
+    Returns:
+        bool: True if the page is blank, False if it has visible content.
+    """
+    # Tier 1 — text is by far the most common content on an invoice
+    if text is None:
+        text = page.get_text("text")
+    if text.strip():
+        return False
+
+    # Tier 2 — nothing drawn at all
+    if images is None:
+        images = page.get_images(full=True)
+    if not images and not page.get_drawings():
+        return True
+
+    # Tier 3 — ambiguous: render once, small, grayscale, uint8
+    import numpy as np
+
+    pix = render_page(page, dpi=dpi, grayscale=True)
+    gray = pixmap_to_array(pix)
+    white_count = np.count_nonzero(gray >= brightness_threshold)
+    return bool(white_count >= white_pixel_ratio * gray.size)
+
+
 def are_pdf_pages_blank(
     pdf_path: str,
-    dpi: int = 200,
+    dpi: int = BLANK_CHECK_DPI,
     brightness_threshold: float = 253.0,
     white_pixel_ratio: float = 0.999,
 ) -> list:
     """
     Detect which pages of a PDF are blank (effectively empty / white).
 
-    A page is considered blank when the ratio of near-white pixels exceeds
-    *white_pixel_ratio*. "Near-white" means every RGB channel of a pixel is
+    Each page is classified by ``is_page_blank``: pages with text are never
+    rendered, and pages without any text, drawings or images are blank
+    outright. Only the remaining pages are rasterised, and such a page is
+    considered blank when the ratio of near-white pixels exceeds
+    *white_pixel_ratio*. "Near-white" means the gray value of a pixel is
     at or above *brightness_threshold* (0-255 scale).
 
     Args:
         pdf_path (str): Path to the PDF file to inspect.
-        dpi (int): Resolution used when rasterising each page (default: 150).
-            Lower values are faster; higher values catch faint marks more
-            reliably.
-        brightness_threshold (float): Minimum channel value (0-255) for a
+        dpi (int): Resolution used when a page has to be rasterised
+            (default: 36). Lower values are faster; higher values catch
+            faint marks more reliably.
+        brightness_threshold (float): Minimum gray value (0-255) for a
             pixel to be counted as white (default: 253).
         white_pixel_ratio (float): Fraction of pixels that must be white for a
             page to be classified as blank (default: 0.999, i.e. 99.9%).
@@ -205,18 +358,109 @@ def are_pdf_pages_blank(
     if not pdf_path.exists():
         raise FileNotFoundError(f"PDF file not found: {pdf_path}")
 
-    images = convert_from_path(str(pdf_path), dpi=dpi, fmt="png")
+    with fitz.open(str(pdf_path)) as doc:
+        return [
+            is_page_blank(page, dpi, brightness_threshold, white_pixel_ratio)
+            for page in doc
+        ]
+
+
+def check_pdf_structure(doc, max_pages: int = 1, dpi: int = BLANK_CHECK_DPI) -> None:
+    """
+    Validate the structure of an already-open PDF document.
+
+    The page count is read from the document metadata, so no page is
+    rendered to count pages. The blank check on the first page only
+    rasterises it when its text, drawings and images are inconclusive.
+
+    Rules:
+        1. The PDF must contain at least one and at most *max_pages* pages.
+        2. The first page must **not** be blank.
+
+    Args:
+        doc (fitz.Document | InvoiceDocument): The open PDF document. An
+            ``InvoiceDocument`` reuses its cached page text and images.
+        max_pages (int): Maximum number of pages accepted (default: 1).
+        dpi (int): Resolution of the fallback blank-page render (default: 36).
+
+    Raises:
+        ValueError: If any structural rule is violated. The message is
+            suitable for returning to the caller as-is.
 
-    results = []
-    for img in images:
-        # Convert to RGB to handle RGBA / palette-mode PDFs uniformly
-        rgb = np.array(img.convert("RGB"), dtype=np.float32)
-        # A pixel is "white" when all three channels exceed the threshold
-        white_mask = np.all(rgb >= brightness_threshold, axis=-1)
-        ratio = white_mask.sum() / white_mask.size
-        results.append(bool(ratio >= white_pixel_ratio))
+    Example:
+        >>> with fitz.open("invoice.pdf") as doc:
+        ...     check_pdf_structure(doc)
+    """
+    page_count = doc.page_count
+
+    # Rule 1 — page count, straight from the document metadata
+    if page_count == 0:
+        raise ValueError("Invalid PDF: the file contains no pages.")
+    if page_count > max_pages:
+        limit = (
+            "Only single-page invoices are accepted."
+            if max_pages == 1
+            else f"At most {max_pages} pages are accepted."
+        )
+        raise ValueError(f"Invalid PDF: the file contains {page_count} pages. {limit}")
 
-    return results
+    # Rule 2 — the first page must not be blank
+    if isinstance(doc, fitz.Document):
+        first_page_blank = is_page_blank(doc[0], dpi=dpi)
+    else:
+        first_page_blank = doc.is_page_blank(0, dpi=dpi)
+    if first_page_blank:
+        raise ValueError("Invalid PDF: the first page is blank.")
+
+
+# Text of the synthetic warm-up invoice, as (x, y, text) in points on an A4
+# page; shaped like the real invoices, with made-up values
+_SAMPLE_INVOICE_TEXT = (
+    (40, 50, "Sample Services Limited"),
+    (40, 64, "1 Sample Road, Kolkata- 700001. CIN No:U00000WB2000PLC000000"),
+    (40, 78, "GST NO:19AAAAA0000A1Z5"),
+    (400, 110, "Date : 01 Jan 2026"),
+    (400, 124, "Invoice : SAMPLE/0001/26"),
+    (400, 138, "Service Month : December,2025"),
+    (250, 160, "TAX INVOICE"),
+    (40, 190, "Bill To:-"),
+    (40, 204, "SAMPLE CUSTOMER PRIVATE LIMITED"),
+    (40, 218, "2 Sample Street, Pune, Maharashtra, 411001"),
+    (40, 232, "GSTIN : 27AAAAA0000A1Z5"),
+    (40, 246, "Place of Supply: MAHARASHTRA-27"),
+    (40, 280, "Sl. No."), (80, 280, "Resource Name"), (200, 280, "HSN/SAC"), (260, 280, "PO No."),
+    (320, 280, "Bill Rate"), (380, 280, "Taxable Value"), (450, 280, "IGST(18%)"), (510, 280, "Total INR"),
+    (40, 300, "1"), (80, 300, "SAMPLE RESOURCE"), (200, 300, "998513"), (260, 300, "8000000000"),
+    (320, 300, "10000.00"), (380, 300, "10000.00"), (450, 300, "1800.00"), (510, 300, "11800.00"),
+    (40, 320, "Total Invoice Value"), (380, 320, "10000.00"), (450, 320, "1800.00"), (510, 320, "11800.00"),
+    (40, 340, "Total Invoice Value( In Words): Rupees Eleven Thousand Eight Hundred and Paisa Only."),
+    (40, 370, "NOTE:"),
+    (40, 384, "1. Please check the amount of the bill and inform us within 48 hours."),
+    (40, 414, "Bank details for money transfer as follows"),
+    (40, 428, "Account Number : 00000000000000"),
+    (40, 442, "Beneficiary Name :Sample Services Limited"),
+    (40, 456, "IFSC Code : SAMP0000001"),
+    (40, 470, "Bank Name : SAMPLE BANK"),
+    (400, 520, "Authorised Signatory"),
+)
+
+
+def sample_invoice_pdf() -> bytes:
+    """
+    Build a one-page PDF laid out like a real invoice, with made-up values.
+
+    Used to warm up executor workers: processing it loads fonts, fills the
+    regex caches and runs every extraction and validation stage once, so
+    the first real invoice on a fresh worker runs at steady-state speed.
+
+    Returns:
+        bytes: The PDF.
+    """
+    with fitz.open() as doc:
+        page = doc.new_page(width=595, height=842)
+        for x, y, text in _SAMPLE_INVOICE_TEXT:
+            page.insert_text((x, y), text, fontsize=8)
+        return doc.tobytes()
 
 
 GSPPI_API_URL = "https://gsppi.geniusconsultant.com/GSPPI_API_V2/api/Invoice/GetDigitalInvoice"
@@ -230,6 +474,8 @@ def fetch_digital_invoices() -> list:
 
     Makes a POST request to the GetDigitalInvoice endpoint using bearer token
     authentication and returns the list of invoice records from Response_Data.
+    The request goes over the shared pooled session (see http_client), so
+    transient failures are retried with backoff.
 
     Returns:
         list: A list of dicts, each containing 'BillID', 'Url', and 'DocType'.
@@ -248,15 +494,17 @@ def fetch_digital_invoices() -> list:
             ...
         ]
     """
+    import requests
+
     try:
-        response = requests.post(
+        response = get_session().post(
             GSPPI_API_URL,
             headers={
                 "Authorization": f"Bearer {GSPPI_BEARER_TOKEN}",
                 "Content-Type": "application/json"
             },
             json={"SecurityCode": GSPPI_SECURITY_CODE},
-            timeout=30
+            timeout=DEFAULT_TIMEOUT
         )
         response.raise_for_status()
     except requests.RequestException as e:
@@ -274,10 +522,185 @@ def fetch_digital_invoices() -> list:
     return data.get("Response_Data", [])
 
 
+# Largest PDF accepted from a URL, matching the upload limit
+MAX_DOWNLOAD_BYTES = int(os.getenv("MAX_DOWNLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# Downloads up to this size stay in memory; larger ones are spooled to disk
+DOWNLOAD_SPOOL_BYTES = int(os.getenv("DOWNLOAD_SPOOL_BYTES", str(4 * 1024 * 1024)))
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+# Readers accept junk before the header, but only within the first 1 KB
+PDF_MAGIC = b"%PDF-"
+PDF_HEADER_WINDOW = 1024
+
+
+class PdfDownload:
+    """
+    A PDF fetched by fetch_pdf.
+
+    Attributes:
+        source (bytes | str | None): The body, or the path of the temp file
+            holding it; None when the server answered 304 Not Modified.
+        content_hash (str | None): SHA-256 hex digest of the body.
+        etag (str | None): The response's ETag header.
+        last_modified (str | None): The response's Last-Modified header.
+        not_modified (bool): True if the server answered 304 Not Modified.
+    """
+
+    def __init__(self, source, content_hash=None, etag=None, last_modified=None, not_modified=False):
+        self.source = source
+        self.content_hash = content_hash
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+
+
+def _stream_pdf(url: str, spool_bytes: int, etag: str = None, last_modified: str = None) -> PdfDownload:
+    """
+    Stream a PDF from *url*, checking its header and size as it arrives.
+
+    The body is read in DOWNLOAD_CHUNK_BYTES chunks and hashed on the way
+    through. The download stops as soon as the header is missing from the
+    first PDF_HEADER_WINDOW bytes or the body passes MAX_DOWNLOAD_BYTES, so
+    a bad URL never costs more than a chunk past the limit.
+
+    Passing the *etag* / *last_modified* of an earlier download makes the
+    request conditional; a server that supports it answers 304 without a
+    body.
+
+    Returns:
+        PdfDownload: The body is held in memory, or in a temp file once it
+        grew past *spool_bytes*.
+    """
+    import requests
+
+    if not url:
+        raise ValueError("URL must not be empty.")
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    limit_mb = MAX_DOWNLOAD_BYTES / (1024 * 1024)
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    tmp = None
+    size = 0
+
+    try:
+        with get_session().get(url, timeout=DEFAULT_TIMEOUT, stream=True, headers=headers) as response:
+            validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            if response.status_code == 304 and headers:
+                return PdfDownload(None, None, *validators, not_modified=True)
+            response.raise_for_status()
+
+            declared = response.headers.get("Content-Length", "")
+            if declared.isdigit() and int(declared) > MAX_DOWNLOAD_BYTES:
+                raise RuntimeError(
+                    f"PDF at '{url}' is {int(declared) / (1024 * 1024):.2f} MB, "
+                    f"over the {limit_mb:g} MB download limit."
+                )
+
+            header_checked = False
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > MAX_DOWNLOAD_BYTES:
+                    raise RuntimeError(f"PDF at '{url}' exceeds the {limit_mb:g} MB download limit.")
+                digest.update(chunk)
+
+                if tmp is not None:
+                    tmp.write(chunk)
+                    continue
+                buffer += chunk
+
+                if not header_checked and len(buffer) >= PDF_HEADER_WINDOW:
+                    if PDF_MAGIC not in buffer[:PDF_HEADER_WINDOW]:
+                        raise ValueError(f"Invalid PDF: the file at '{url}' is not a PDF.")
+                    header_checked = True
+
+                if header_checked and len(buffer) > spool_bytes:
+                    import tempfile
+                    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+                    tmp.write(buffer)
+                    buffer = None
+
+    except Exception as e:
+        if tmp is not None:
+            tmp.close()
+            os.remove(tmp.name)
+        if isinstance(e, requests.RequestException):
+            raise RuntimeError(f"Failed to download PDF from '{url}': {e}")
+        raise
+
+    if tmp is not None:
+        tmp.close()
+        return PdfDownload(tmp.name, digest.hexdigest(), *validators)
+
+    # Bodies shorter than the header window are checked once complete
+    if PDF_MAGIC not in buffer[:PDF_HEADER_WINDOW]:
+        raise ValueError(f"Invalid PDF: the file at '{url}' is not a PDF.")
+    return PdfDownload(bytes(buffer), digest.hexdigest(), *validators)
+
+
+def fetch_pdf(url: str, etag: str = None, last_modified: str = None) -> PdfDownload:
+    """
+    Download a PDF like download_pdf, but also report how to recognise it.
+
+    The result carries the body's SHA-256 and the server's ETag and
+    Last-Modified headers. Passing the validators of an earlier download
+    makes the request conditional, so an unchanged PDF costs no body.
+
+    Args:
+        url (str): The direct URL of the PDF file to download.
+        etag (str, optional): ETag of the previous download.
+        last_modified (str, optional): Last-Modified of the previous download.
+
+    Returns:
+        PdfDownload: See its attributes. A ``str`` source is a temporary
+        file that the caller must delete.
+
+    Raises:
+        ValueError: If the URL is empty or the body is not a PDF.
+        RuntimeError: If the download fails, the server returns an error
+                      status, or the body exceeds MAX_DOWNLOAD_BYTES.
+    """
+    return _stream_pdf(url, DOWNLOAD_SPOOL_BYTES, etag=etag, last_modified=last_modified)
+
+
+def download_pdf(url: str):
+    """
+    Download a PDF from a URL, in memory when it is small enough.
+
+    The body is streamed with a size cap and a header check (see
+    _stream_pdf). PDFs up to DOWNLOAD_SPOOL_BYTES are returned as bytes,
+    ready for ``fitz.open(stream=...)``; larger ones are written to a named
+    temporary file, which the caller must delete.
+
+    Args:
+        url (str): The direct URL of the PDF file to download.
+
+    Returns:
+        bytes | str: The PDF bytes, or the path of the temporary file.
+
+    Raises:
+        ValueError: If the URL is empty or the body is not a PDF.
+        RuntimeError: If the download fails, the server returns a non-200
+                      status, or the body exceeds MAX_DOWNLOAD_BYTES.
+    """
+    return _stream_pdf(url, DOWNLOAD_SPOOL_BYTES).source
+
+
 def download_pdf_from_url(url: str) -> str:
     """
     Download a PDF from a URL and save it to a named temporary file.
 
+    Downloads share the pooled session (see http_client), so repeated
+    downloads from one host reuse its keep-alive connections. The body is
+    streamed to disk with the same size cap and header check as
+    download_pdf.
     The caller is responsible for deleting the temp file after use.
 
     Args:
@@ -287,37 +710,31 @@ def download_pdf_from_url(url: str) -> str:
         str: Absolute path to the saved temporary PDF file.
 
     Raises:
-        ValueError: If the URL is empty or None.
-        RuntimeError: If the download fails or the server returns a non-200 status.
+        ValueError: If the URL is empty or None, or the body is not a PDF.
+        RuntimeError: If the download fails, the server returns a non-200
+                      status, or the body exceeds MAX_DOWNLOAD_BYTES.
 
     Example:
         >>> path = download_pdf_from_url("https://example.com/invoice.pdf")
         >>> print(path)  # /tmp/tmpXXXXXX.pdf
     """
-    if not url:
-        raise ValueError("URL must not be empty.")
-
-    try:
-        response = requests.get(url, timeout=60)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        raise RuntimeError(f"Failed to download PDF from '{url}': {e}")
+    source = _stream_pdf(url, 0).source
+    if isinstance(source, str):
+        return source
 
+    # Shorter than one chunk, so it never reached the spool threshold
     import tempfile
     with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(response.content)
+        tmp.write(source)
         return tmp.name
 
 
-PROCESSED_LOG_PATH = os.getenv("PROCESSED_LOG_PATH", "processed_invoices.json")
-
-
 def load_processed_log() -> dict:
     """
-    Load the processed invoices log from disk.
+    Load the processed invoices log.
 
-    If the log file does not exist yet, an empty dict is returned without
-    raising an error — the file will be created on the first write.
+    The log lives in a SQLite database (see processed_log); an empty dict
+    is returned while nothing has been recorded yet.
 
     Returns:
         dict: A dict keyed by BillID. Each value is a dict containing at least:
@@ -333,22 +750,19 @@ def load_processed_log() -> dict:
             }
         }
     """
-    if not os.path.exists(PROCESSED_LOG_PATH):
-        return {}
-
-    with open(PROCESSED_LOG_PATH, "r", encoding="utf-8") as f:
-        content = f.read().strip()
-        if not content:
-            return {}
-        return json.loads(content)
+    return get_processed_log().all()
 
 
-def update_processed_log(bill_id: str, status: str, url: str = "", doc_type: str = "", error: str = None):
+def update_processed_log(bill_id: str, status: str, url: str = "", doc_type: str = "", error: str = None,
+                         content_hash: str = None, etag: str = None, last_modified: str = None,
+                         result: dict = None):
     """
-    Append or update a BillID entry in the processed invoices log and write to disk.
+    Append or update a BillID entry in the processed invoices log.
 
     If the BillID already exists in the log (e.g. a previously failed invoice
     that the client has resent), its entry is overwritten with the latest outcome.
+    The write is a single-row upsert, safe to run from several worker
+    processes at once.
 
     Args:
         bill_id (str): The invoice BillID (e.g. 'GWBIAR/FB0001/26').
@@ -357,22 +771,16 @@ def update_processed_log(bill_id: str, status: str, url: str = "", doc_type: str
         doc_type (str): The DocType value from the GSPPI API.
         error (str, optional): Error message to record when status is 'failed'.
                                Pass None for successful processing.
+        content_hash (str, optional): SHA-256 of the processed PDF.
+        etag (str, optional): The PDF's ETag header.
+        last_modified (str, optional): The PDF's Last-Modified header.
+        result (dict, optional): The batch result, reused when the same PDF
+                                 comes back unchanged.
 
     Raises:
-        IOError: If the log file cannot be written.
+        sqlite3.Error: If the log cannot be written.
     """
-    log = load_processed_log()
-
-    entry = {
-        "processed_at": datetime.now(timezone.utc).isoformat(),
-        "status": status,
-        "url": url,
-        "doc_type": doc_type
-    }
-    if error is not None:
-        entry["error"] = error
-
-    log[bill_id] = entry
-
-    with open(PROCESSED_LOG_PATH, "w", encoding="utf-8") as f:
-        json.dump(log, f, indent=4, ensure_ascii=False)
\ No newline at end of file
+    get_processed_log().upsert(
+        bill_id, status, url=url, doc_type=doc_type, error=error,
+        content_hash=content_hash, etag=etag, last_modified=last_modified, result=result,
+    )
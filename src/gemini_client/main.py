@@ -20,9 +20,14 @@ import os
 from pathlib import Path
 from typing import Any, Dict
 
+# Load .env before any module reads its settings
+from dotenv import load_dotenv
+load_dotenv()
+
+from document import InvoiceDocument
 from gemini_client import GeminiClient
 from validator import InvoiceValidator
-from helper import pdf_to_png_images, are_pdf_pages_blank
+from helper import check_pdf_structure
 
 
 # ---------------------------------------------------------------------------
@@ -48,30 +53,14 @@ class InvoiceProcessor:
     # PDF helpers
     # ------------------------------------------------------------------
 
-    def _validate_pdf(self, pdf_path: str) -> None:
+    def _validate_pdf(self, document: InvoiceDocument) -> None:
         """Ensure the PDF is a single, non-blank page."""
-        pages = pdf_to_png_images(pdf_path, dpi=150)
-
-        if len(pages) > 1:
-            raise ValueError(
-                f"Invalid PDF: contains {len(pages)} pages. "
-                "Only single-page invoices are accepted."
-            )
-
-        blank_flags = are_pdf_pages_blank(pdf_path, dpi=150)
-        if blank_flags[0]:
-            raise ValueError("Invalid PDF: the first page is blank.")
+        check_pdf_structure(document, max_pages=1)
 
-    def _pdf_to_jpg_tmp(self, pdf_path: str) -> str:
-        """Render the first PDF page to a temporary JPEG file."""
-        import tempfile
-        pages = pdf_to_png_images(pdf_path, dpi=200)
-        page_image = pages[0].convert("RGB")
-
-        tmp = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
-        tmp.close()
-        page_image.save(tmp.name, format="JPEG", quality=95)
-        return tmp.name
+    def _pdf_to_jpg(self, document: InvoiceDocument) -> bytes:
+        """Render the first PDF page to JPEG bytes, in memory."""
+        pix = document.pixmap(0, dpi=200)
+        return pix.tobytes(output="jpg", jpg_quality=95)
 
     # ------------------------------------------------------------------
     # Core steps
@@ -82,18 +71,17 @@ class InvoiceProcessor:
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"Invoice PDF not found: {pdf_path}")
 
-        print(f"[1/3] Validating PDF …")
-        self._validate_pdf(pdf_path)
-        print("      PDF validation passed.")
-
-        jpg_tmp = self._pdf_to_jpg_tmp(pdf_path)
-        try:
-            print(f"[2/3] Extracting data with Gemini …")
-            data = self.gemini_client.extract_invoice_data(jpg_tmp)
-            print("      Extraction complete.")
-        finally:
-            if os.path.exists(jpg_tmp):
-                os.remove(jpg_tmp)
+        # One document is shared by validation and rendering
+        with InvoiceDocument(pdf_path) as document:
+            print(f"[1/3] Validating PDF …")
+            self._validate_pdf(document)
+            print("      PDF validation passed.")
+
+            jpg_bytes = self._pdf_to_jpg(document)
+
+        print(f"[2/3] Extracting data with Gemini …")
+        data = self.gemini_client.extract_invoice_data(jpg_bytes)
+        print("      Extraction complete.")
 
         return data
 
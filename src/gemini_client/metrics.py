@@ -0,0 +1,203 @@
+"""
+Metrics Module
+
+Per-stage latency instrumentation and a Prometheus text exporter, without
+extra dependencies.
+
+Each request (or GSPPI invoice) collects its stage timings in a
+StageTimings, using ``time.perf_counter`` (a few microseconds per
+stage). Stages that run on a process-pool worker are timed there and sent
+back with the result as a plain dict, then merged. Once the request is
+done, record_stages adds its timings to the ``invoice_stage_seconds``
+histogram, labelled by pipeline and stage.
+
+render_metrics produces the /metrics page: every histogram, followed by
+gauges and counters for the figures other modules already keep (executor,
+admission, result cache, HTTP pool, jobs).
+
+Metrics are per process: with several uvicorn workers, each one reports
+only its own requests.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# Seconds; spans a cached lookup (~1 ms) up to a slow Gemini call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class StageTimings:
+    """
+    Wall-clock time per stage for one request or invoice.
+
+    Timing the same stage twice adds the durations together.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage *name*."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def call(self, name: str, func: Callable, *args, **kwargs) -> Any:
+        """Return ``func(*args, **kwargs)``, timed as stage *name*."""
+        with self.stage(name):
+            return func(*args, **kwargs)
+
+    def add(self, name: str, seconds: float):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def merge(self, seconds: Optional[Dict[str, float]]):
+        """Add timings collected elsewhere, e.g. on an executor worker."""
+        for name, value in (seconds or {}).items():
+            self.add(name, value)
+
+    def as_ms(self) -> Dict[str, float]:
+        """Timings in milliseconds, for a debug response."""
+        return {name: round(value * 1000, 3) for name, value in self.seconds.items()}
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """
+    A Prometheus histogram with a fixed set of label names.
+
+    Thread-safe.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): HELP text.
+        label_names (tuple): Names of the labels every observation carries.
+        buckets (tuple): Upper bounds, ascending; +Inf is added.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (not cumulative), then sum and count
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in sorted(self._series.items())]
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels(self.label_names, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+stage_seconds = Histogram(
+    "invoice_stage_seconds",
+    "Time spent in each processing stage.",
+    ("pipeline", "stage"),
+)
+admission_wait_seconds = Histogram(
+    "invoice_admission_wait_seconds",
+    "Time requests waited in an admission queue before being admitted.",
+    ("group",),
+)
+
+HISTOGRAMS = (stage_seconds, admission_wait_seconds)
+
+
+def record_stages(pipeline: str, timings: StageTimings):
+    """Add one request's (or invoice's) stage timings to the histogram."""
+    for name, seconds in timings.seconds.items():
+        stage_seconds.observe(seconds, pipeline, name)
+
+
+def render_metrics(gauges: Dict[str, Dict[str, Any]],
+                   labelled_gauges: Optional[Dict[str, Dict[str, Dict[str, dict]]]] = None,
+                   counters: Optional[Dict[str, Tuple[str, ...]]] = None) -> str:
+    """
+    Render every histogram plus the given figures in Prometheus text format.
+
+    Args:
+        gauges (dict): Metric prefix → stats dict, e.g.
+            ``{"invoice_executor": executor_info()}``. Numeric values become
+            gauges named ``<prefix>_<key>``; other values are skipped.
+        labelled_gauges (dict, optional): Metric prefix → label name →
+            label value → stats dict, for figures kept per group, e.g.
+            ``{"invoice_admission": {"group": {"processing": {...}}}}``.
+        counters (dict, optional): Metric prefix → the keys of its stats
+            that only ever increase, e.g. ``{"invoice_executor":
+            ("completed", "failed")}``. These become counters named
+            ``<prefix>_<key>_total``, so rate() and increase() treat a
+            process restart as a counter reset.
+
+    Returns:
+        str: The exposition text.
+    """
+    # (name, type) → samples, so each name gets a single TYPE line
+    samples = {}
+
+    def add(prefix, stats, labels=""):
+        counter_keys = (counters or {}).get(prefix, ())
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if key in counter_keys:
+                name, kind = f"{prefix}_{key}_total", "counter"
+            else:
+                name, kind = f"{prefix}_{key}", "gauge"
+            samples.setdefault((name, kind), []).append(f"{name}{labels} {value}")
+
+    for prefix, stats in gauges.items():
+        add(prefix, stats)
+    for prefix, by_label in (labelled_gauges or {}).items():
+        for label_name, groups in by_label.items():
+            for label_value, stats in groups.items():
+                add(prefix, stats, _format_labels((label_name,), (label_value,)))
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for (name, kind), series in samples.items():
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(series)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,128 @@
+"""
+Responses Module
+
+JSON encoding for API responses.
+
+dumps() encodes with orjson when it is installed (pip install orjson),
+several times faster than the standard library, and falls back to the
+json module otherwise or for anything orjson cannot encode (integers
+beyond 64 bits, for instance). Both produce compact UTF-8 JSON.
+
+- FastJSONResponse is a JSONResponse that encodes with dumps().
+- StreamingJSONResponse encodes a large body (a batch with hundreds of
+  invoices) piece by piece on a worker thread and sends it in chunks as it
+  goes, so the event loop is never blocked on one long encode and the
+  whole body is never held in memory twice.
+
+Configuration (environment):
+    JSON_ENCODER    "auto" (default; orjson if installed), "orjson" or
+                    "json".
+"""
+
+import json
+import os
+from typing import Any, Iterator, Mapping, Optional
+
+from fastapi.responses import JSONResponse, StreamingResponse
+
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto").lower()
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if JSON_ENCODER == "orjson" and orjson is None:
+    raise ImportError("JSON_ENCODER=orjson needs orjson: pip install orjson")
+
+# Bytes gathered before a StreamingJSONResponse sends a chunk
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def _json_dumps(content: Any) -> bytes:
+    # Same settings as Starlette's JSONResponse
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+if orjson is not None and JSON_ENCODER != "json":
+    ACTIVE_ENCODER = "orjson"
+
+    def dumps(content: Any) -> bytes:
+        """Encode *content* as compact UTF-8 JSON."""
+        try:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            return _json_dumps(content)
+else:
+    ACTIVE_ENCODER = "json"
+
+    def dumps(content: Any) -> bytes:
+        """Encode *content* as compact UTF-8 JSON."""
+        return _json_dumps(content)
+
+
+def _dumps_key(key: Any) -> bytes:
+    # Object keys are always strings; convert others as json does
+    return dumps(key if isinstance(key, str) else json.dumps(key))
+
+
+def _iter_pieces(content: Any, depth: int) -> Iterator[bytes]:
+    # Split objects and arrays down to *depth* levels; encode the rest whole
+    if depth and isinstance(content, dict) and content:
+        separator = b"{"
+        for key, value in content.items():
+            yield separator + _dumps_key(key) + b":"
+            yield from _iter_pieces(value, depth - 1)
+            separator = b","
+        yield b"}"
+    elif depth and isinstance(content, (list, tuple)) and content:
+        separator = b"["
+        for value in content:
+            yield separator
+            yield from _iter_pieces(value, depth - 1)
+            separator = b","
+        yield b"]"
+    else:
+        yield dumps(content)
+
+
+def iter_json(content: Any, depth: int = 2, chunk_size: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    Encode *content* incrementally, yielding chunks of about *chunk_size*
+    bytes. Joined, they equal ``dumps(content)``.
+
+    Args:
+        content: The document to encode.
+        depth (int): Levels of objects and arrays split into their items;
+            the default reaches each entry of a batch response's results.
+        chunk_size (int): Bytes gathered before a chunk is yielded.
+    """
+    buffer = bytearray()
+    for piece in _iter_pieces(content, depth):
+        buffer += piece
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with dumps()."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class StreamingJSONResponse(StreamingResponse):
+    """
+    A JSON response encoded incrementally with iter_json().
+
+    The body is sent with chunked transfer encoding, so there is no
+    Content-Length. Use it for large bodies only.
+    """
+
+    def __init__(self, content: Any, status_code: int = 200, headers: Optional[Mapping[str, str]] = None):
+        # A plain iterator: Starlette runs each step on a worker thread
+        super().__init__(iter_json(content), status_code=status_code, headers=headers,
+                         media_type="application/json")
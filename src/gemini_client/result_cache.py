@@ -0,0 +1,192 @@
+"""
+Result Cache Module
+
+Content-addressed cache of processing results. The same PDF is often
+processed more than once (client retries, or an invoice arriving by upload
+and through GSPPI), and a hit skips rendering, extraction and validation
+entirely.
+
+Keys are the SHA-256 of the PDF bytes combined with a version tag naming
+the extractor and validator (see cache_key), so changing either one
+invalidates every earlier result.
+
+Two tiers:
+    memory  An in-process LRU holding up to RESULT_CACHE_MAX_BYTES of
+            JSON-encoded results.
+    disk    Optional (RESULT_CACHE_DIR): one JSON file per key, shared by
+            all worker processes and kept across restarts. Disk hits are
+            promoted to memory. Clear it by deleting the directory.
+
+Configuration (environment):
+    RESULT_CACHE_MAX_BYTES  Memory tier budget (default 64 MB; 0 disables it).
+    RESULT_CACHE_DIR        Disk tier directory (default: no disk tier).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+
+
+def cache_key(content_hash: str, version_tag: str) -> str:
+    """
+    Build the cache key for a PDF.
+
+    Args:
+        content_hash (str): SHA-256 hex digest of the PDF bytes.
+        version_tag (str): Identifies everything that shapes the result,
+            e.g. "pymupdf:1:text|validator:1".
+
+    Returns:
+        str: A hex key, safe to use as a file name.
+    """
+    return hashlib.sha256(f"{content_hash}|{version_tag}".encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier (memory LRU + optional disk) cache of JSON-serialisable results.
+
+    Thread-safe. Values are stored JSON-encoded, so the byte budget counts
+    what is actually held, and every hit returns a fresh copy that callers
+    may modify.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, disk_dir: str = RESULT_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ------------------------------------------------------------------
+    # Memory tier
+    # ------------------------------------------------------------------
+
+    def _remember(self, key: str, blob: bytes):
+        # Caller holds the lock
+        if len(blob) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = blob
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    # ------------------------------------------------------------------
+    # Disk tier
+    # ------------------------------------------------------------------
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, blob: bytes):
+        # Write-then-rename, so readers in other processes never see a
+        # partial file
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            print(f"Warning: Failed to write result cache entry {key}: {e}")
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached result for *key*, or None on a miss."""
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(blob)
+
+        if self.disk_dir:
+            blob = self._read_disk(key)
+            if blob is not None:
+                try:
+                    value = json.loads(blob)
+                except ValueError:
+                    value = None  # Truncated by a crash; treat as a miss
+                if value is not None:
+                    with self._lock:
+                        self.disk_hits += 1
+                        self._remember(key, blob)
+                    return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any):
+        """Store *value* (JSON-serialisable) under *key* in both tiers."""
+        blob = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._remember(key, blob)
+        if self.disk_dir:
+            self._write_disk(key, blob)
+
+    def clear(self):
+        """Empty the memory tier (the disk tier is left alone)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Hit, miss and eviction counters plus current memory usage."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_dir": self.disk_dir,
+            }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Return the process-wide ResultCache."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
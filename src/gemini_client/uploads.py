@@ -0,0 +1,264 @@
+"""
+Uploads Module
+
+Reads multi-file uploads (multipart/form-data) straight off the request
+stream, enforcing size limits as the bytes arrive instead of after the
+whole body has been buffered:
+
+- a file larger than the per-file limit stops being buffered at the limit
+  and is reported as failed, while the rest of the request is still read;
+- a request body larger than the total limit is rejected as soon as it
+  passes it.
+
+Each file is handed to the caller the moment its part ends, so processing
+can start while later files are still uploading.
+
+Zip archives are expanded into their members with the same limits. One
+UploadBudget per request is shared by the body and every archive in it,
+so the uncompressed members count toward the same byte and file limits:
+neither one archive nor several can expand into an unbounded amount of
+memory.
+"""
+
+import io
+import os
+import zipfile
+from typing import AsyncIterator, List, Optional
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+
+class UploadTooLarge(Exception):
+    """Raised when a request exceeds its total size or file-count limit."""
+
+
+class UploadedFile:
+    """
+    One file from a multi-file upload.
+
+    Attributes:
+        filename (str): As sent by the client; for zip members,
+            ``<archive>/<member path>``.
+        content_type (str): As sent by the client ('' for zip members).
+        data (bytes | None): The file's bytes, or None if it was rejected.
+        error (str | None): Why the file was rejected.
+    """
+
+    def __init__(self, filename: str, content_type: str = "", data: Optional[bytes] = None,
+                 error: Optional[str] = None):
+        self.filename = filename
+        self.content_type = content_type
+        self.data = data
+        self.error = error
+
+    @property
+    def is_zip(self) -> bool:
+        return self.content_type in ZIP_CONTENT_TYPES or self.filename.lower().endswith(".zip")
+
+
+class UploadBudget:
+    """
+    The bytes and files one request may still buffer.
+
+    Shared by read_multipart and every expand_zip call of the request, so
+    each of them takes from the same limits.
+
+    Attributes:
+        max_bytes (int): Most bytes buffered, body and zip members together.
+        max_files (int): Most files accepted, zip members included.
+        bytes (int): Bytes taken so far.
+        files (int): Files taken so far.
+    """
+
+    def __init__(self, max_bytes: int, max_files: int):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.bytes = 0
+        self.files = 0
+
+    def take_bytes(self, size: int, what: str = "Request body") -> None:
+        """Take *size* bytes, raising UploadTooLarge past the limit."""
+        self.bytes += size
+        if self.bytes > self.max_bytes:
+            raise UploadTooLarge(
+                f"{what} exceeds the maximum allowed size of {self.max_bytes / (1024 * 1024):g} MB."
+            )
+
+    def take_file(self) -> None:
+        """Take one file, raising UploadTooLarge past the limit."""
+        self.files += 1
+        if self.files > self.max_files:
+            raise UploadTooLarge(f"Too many files; at most {self.max_files} are accepted per request.")
+
+    def release_file(self) -> None:
+        """Give back one file, e.g. an archive replaced by its members."""
+        self.files -= 1
+
+
+def _too_large_message(limit: int, size: Optional[int] = None) -> str:
+    message = f"File size exceeds the maximum allowed size of {limit / (1024 * 1024):g} MB."
+    if size is not None:
+        message += f" Received: {size / (1024 * 1024):.2f} MB"
+    return message
+
+
+async def read_multipart(content_type: str, stream: AsyncIterator[bytes], max_file_bytes: int,
+                         budget: UploadBudget) -> AsyncIterator[UploadedFile]:
+    """
+    Yield each file of a multipart/form-data body as soon as it has arrived.
+
+    Form fields without a filename are ignored. Zip archives are buffered
+    up to the budget's byte limit rather than *max_file_bytes*; expand
+    them with expand_zip and the same budget.
+
+    Args:
+        content_type (str): The request's Content-Type header.
+        stream (async iterator): The request body, e.g. ``request.stream()``.
+        max_file_bytes (int): Largest file accepted.
+        budget (UploadBudget): The request's limits; every body byte and
+            file is taken from it.
+
+    Raises:
+        ValueError: If the body is not multipart/form-data or is malformed.
+        UploadTooLarge: If the body, together with whatever else has taken
+            from *budget*, exceeds its byte or file limit.
+    """
+    mime_type, options = parse_options_header(content_type)
+    boundary = options.get(b"boundary")
+    if mime_type != b"multipart/form-data" or not boundary:
+        raise ValueError("Expected a multipart/form-data body")
+
+    finished = []
+    state = {"headers": {}, "field": b"", "value": b"", "file": None, "buffer": None, "size": 0, "limit": 0}
+
+    def on_part_begin():
+        state.update(headers={}, file=None, buffer=None, size=0)
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].lower()] = state["value"]
+        state["field"] = state["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        if b"filename" not in disposition:
+            return  # A plain form field
+        budget.take_file()
+        part_type, _ = parse_options_header(state["headers"].get(b"content-type", b""))
+        upload = UploadedFile(
+            os.path.basename(disposition[b"filename"].decode("utf-8", "replace").replace("\\", "/")),
+            part_type.decode("latin-1"),
+        )
+        state["file"] = upload
+        state["limit"] = budget.max_bytes if upload.is_zip else max_file_bytes
+        state["buffer"] = bytearray()
+
+    def on_part_data(data, start, end):
+        upload = state["file"]
+        if upload is None:
+            return
+        state["size"] += end - start
+        if state["buffer"] is not None:
+            if state["size"] > state["limit"]:
+                state["buffer"] = None  # Stop buffering; the rest is discarded
+            else:
+                state["buffer"] += data[start:end]
+
+    def on_part_end():
+        upload = state["file"]
+        if upload is None:
+            return
+        if state["buffer"] is None:
+            upload.error = _too_large_message(state["limit"], state["size"])
+        else:
+            upload.data = bytes(state["buffer"])
+        finished.append(upload)
+        state["file"] = state["buffer"] = None
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    async for chunk in stream:
+        budget.take_bytes(len(chunk))
+        try:
+            parser.write(chunk)
+        except UploadTooLarge:
+            raise
+        except Exception as e:
+            raise ValueError(f"Malformed multipart body: {e}")
+
+        # Hand over completed files; they are not kept here
+        while finished:
+            yield finished.pop(0)
+
+    try:
+        parser.finalize()
+    except Exception as e:
+        raise ValueError(f"Malformed multipart body: {e}")
+    while finished:
+        yield finished.pop(0)
+
+
+def expand_zip(archive: UploadedFile, max_file_bytes: int, budget: UploadBudget) -> List[UploadedFile]:
+    """
+    Return the files inside a zip upload (directories and macOS metadata
+    are skipped).
+
+    Members over *max_file_bytes* are returned as failed without being
+    decompressed. An unreadable archive is returned as a single failed file.
+    The members replace the archive in the file count; their uncompressed
+    bytes are taken from *budget* on top of everything already read.
+
+    Raises:
+        UploadTooLarge: If the members push *budget* past its byte or file
+            limit.
+    """
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(archive.data))
+    except zipfile.BadZipFile:
+        return [UploadedFile(archive.filename, archive.content_type, error="Invalid zip archive.")]
+
+    files = []
+    budget.release_file()
+    with zf:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                continue
+            budget.take_file()
+            upload = UploadedFile(f"{archive.filename}/{name}")
+            files.append(upload)
+            if info.file_size > max_file_bytes:
+                upload.error = _too_large_message(max_file_bytes, info.file_size)
+                continue
+            try:
+                with zf.open(info) as member:
+                    # The recorded size can lie; never read past the limit
+                    data = member.read(max_file_bytes + 1)
+            except (zipfile.BadZipFile, RuntimeError, OSError) as e:
+                upload.error = f"Could not extract file from archive: {e}"
+                continue
+            if len(data) > max_file_bytes:
+                upload.error = _too_large_message(max_file_bytes)
+                continue
+            budget.take_bytes(len(data), "Request body with archive contents")
+            upload.data = data
+    return files
@@ -16,6 +16,7 @@ Dependencies:
     - fastapi
     - uvicorn
     - python-multipart (for file uploads)
+    - orjson (optional; faster JSON responses)
     
 Usage:
     uvicorn api:app --host 0.0.0.0 --port 8000 --reload
@@ -29,25 +30,81 @@ Example API Calls:
          -F "file=@invoice.pdf"
 """
 
+import asyncio
+import hashlib
 import os
-import tempfile
 import traceback
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, List, Optional
 from datetime import datetime
 from datetime import timezone
 
 try:
-    from fastapi import FastAPI, File, UploadFile, HTTPException, status
-    from fastapi.responses import JSONResponse
+    from fastapi import FastAPI, File, Request, UploadFile, HTTPException, status
+    from fastapi.responses import PlainTextResponse, StreamingResponse
     from fastapi.middleware.cors import CORSMiddleware
 except ImportError:
     raise ImportError("Please install FastAPI: pip install fastapi uvicorn python-multipart")
 
 # from gemini_client import GeminiClient
-from pdf_client import PyMuPDFClient
-from validator import InvoiceValidator
-from helper import pdf_to_png_images, are_pdf_pages_blank
-from helper import fetch_digital_invoices, download_pdf_from_url, load_processed_log, update_processed_log
+from document import InvoiceDocument, enable_page_pool
+from pdf_client import PyMuPDFClient, EXTRACTOR_VERSION
+from validator import InvoiceValidator, VALIDATOR_VERSION
+from helper import check_pdf_structure
+from helper import PdfDownload, fetch_digital_invoices, fetch_pdf, load_processed_log, update_processed_log
+from helper import LAZY_MODULES, sample_invoice_pdf, warm_up
+from processed_log import get_processed_log
+from result_cache import cache_key, get_result_cache
+from jobs import JOB_RECOVER_ON_START, JobError, JobRunner, JobStore
+from uploads import UploadBudget, UploadedFile, UploadTooLarge, expand_zip, read_multipart
+from admission import (
+    ADMISSION_BATCH_LIMIT, ADMISSION_BATCH_QUEUE, ADMISSION_CPU_LIMIT, ADMISSION_CPU_QUEUE,
+    AdmissionController, AdmissionMiddleware,
+)
+from metrics import StageTimings, record_stages, render_metrics
+from responses import ACTIVE_ENCODER, FastJSONResponse, StreamingJSONResponse, dumps
+from workers import run_in_executor, shutdown_executor, executor_info
+from workers import EXECUTOR_KIND, EXECUTOR_PRESTART, set_worker_initializer, start_executor, wait_for_workers
+from http_client import close_session, pool_stats
+
+# Line-item table engine for PyMuPDFClient: "text" or "layout"
+EXTRACTION_ENGINE = os.getenv("EXTRACTION_ENGINE", "text")
+
+# Longest invoice accepted; line items may continue onto further pages
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "10"))
+
+# Everything that shapes a result, in the result cache keys: extraction and
+# validation are cached apart, so /extract-only never has to validate
+EXTRACTION_VERSION = f"pymupdf:{EXTRACTOR_VERSION}:{EXTRACTION_ENGINE}"
+VALIDATION_VERSION = f"{EXTRACTION_VERSION}|validator:{VALIDATOR_VERSION}"
+
+# GSPPI batches: invoices in flight at once, and the time each one may take
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", "8"))
+BATCH_INVOICE_TIMEOUT = float(os.getenv("BATCH_INVOICE_TIMEOUT", "300"))
+
+# Processed-log writes run on this one thread: off the event loop, so a
+# writer in another worker process holding the database never stalls this
+# one's requests, and one at a time, in the order they were made
+_log_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="processed-log")
+
+# Default for the batch endpoint's skip_unchanged flag
+BATCH_SKIP_UNCHANGED = os.getenv("BATCH_SKIP_UNCHANGED", "false").lower() in ("1", "true", "yes")
+
+# Import the lazily loaded dependencies at startup instead of on the first
+# request that needs them (see helper.warm_up)
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "true").lower() in ("1", "true", "yes")
+# Whether the startup warm-up has finished (or is off); /health answers 503
+# until it has, so no traffic is routed to a cold worker
+warm_up_state = {"ready": not WARM_UP_ON_START, "error": None}
+
+WARM_UP_MODULES = LAZY_MODULES
+
+# Multi-file uploads (/process-invoices): largest PDF, largest request body
+# and most files per request (zip members included)
+MAX_UPLOAD_FILE_BYTES = 10 * 1024 * 1024
+MAX_UPLOAD_TOTAL_BYTES = int(os.getenv("MAX_UPLOAD_TOTAL_BYTES", str(200 * 1024 * 1024)))
+MAX_UPLOAD_FILES = int(os.getenv("MAX_UPLOAD_FILES", "500"))
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -55,9 +112,23 @@ app = FastAPI(
     description="AI-powered invoice data extraction and validation API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
+# Admission control: CPU-heavy single-invoice routes and batch routes get
+# separate concurrency limits and wait queues. Added before CORS, so CORS
+# stays outermost and rejections carry its headers too. Jobs take slots of
+# the same controllers while they run (see _upload_job and _batch_job).
+cpu_admission = AdmissionController("processing", ADMISSION_CPU_LIMIT, ADMISSION_CPU_QUEUE)
+batch_admission = AdmissionController("batch", ADMISSION_BATCH_LIMIT, ADMISSION_BATCH_QUEUE)
+app.add_middleware(AdmissionMiddleware, routes={
+    "/process-invoice": cpu_admission,
+    "/extract-only": cpu_admission,
+    "/process-invoices": batch_admission,
+    "/process-invoices-from-api": batch_admission,
+})
+
 # Configure CORS - adjust origins as needed for production
 app.add_middleware(
     CORSMiddleware,
@@ -98,32 +169,26 @@ class InvoiceProcessingAPI:
         if self.validator is None:
             self.validator = InvoiceValidator()
     
-    def _save_uploaded_file(self, upload_file: UploadFile) -> str:
+    def _open_pdf_bytes(self, content: bytes, filename: str) -> InvoiceDocument:
         """
-        Save uploaded file to a temporary location.
-        
+        Open an uploaded PDF from its raw bytes.
+
         Args:
-            upload_file (UploadFile): The uploaded file from FastAPI.
-        
+            content (bytes): The upload body.
+            filename (str): Original filename, used in error messages.
+
         Returns:
-            str: Path to the saved temporary file.
-        
+            InvoiceDocument: The open PDF document; the caller must close it.
+
         Raises:
-            HTTPException: If file saving fails.
+            HTTPException 400: If the bytes cannot be parsed as a PDF.
         """
         try:
-            # Create a temporary file with the same extension
-            suffix = os.path.splitext(upload_file.filename)[1]
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-                # Read and write the uploaded file content
-                content = upload_file.file.read()
-                tmp_file.write(content)
-                tmp_file.flush()
-                return tmp_file.name
-        except Exception as e:
+            return InvoiceDocument(content, name=filename)
+        except ValueError as e:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to save uploaded file: {str(e)}"
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
             )
     
     def _cleanup_temp_file(self, file_path: str):
@@ -146,8 +211,8 @@ class InvoiceProcessingAPI:
 
         Only PDF files are accepted. The file must also be within the
         10 MB size limit.  Structural PDF checks (page count, blank page)
-        are performed separately in _validate_pdf_structure after the
-        file has been saved to disk.
+        are performed separately in _validate_pdf_structure once the
+        document has been opened.
 
         Args:
             upload_file (UploadFile): The uploaded file to validate.
@@ -190,40 +255,31 @@ class InvoiceProcessingAPI:
                 )
             )
 
-    def _validate_pdf_structure(self, pdf_path: str):
+    def _validate_pdf_structure(self, document: InvoiceDocument):
         """
         Validate the structural integrity of the uploaded PDF.
 
         Rules:
-            1. The PDF must be exactly **1 page** long.
-            2. The first (and only) page must **not** be blank.
+            1. The PDF must have between 1 and **MAX_PDF_PAGES** pages.
+            2. The first page must **not** be blank.
+
+        The page count comes from the document metadata and the blank check
+        only renders the page when its text and vector content are
+        inconclusive.
 
         Args:
-            pdf_path (str): Absolute path to the temporary PDF file on disk.
+            document (InvoiceDocument): The request's open PDF document.
 
         Raises:
-            HTTPException 400: If the PDF contains more than one page.
+            HTTPException 400: If the PDF has no pages or more than MAX_PDF_PAGES.
             HTTPException 400: If the first page is detected as blank.
         """
-        # Render all pages to PIL images (low DPI is fast enough for counting)
-        pages = pdf_to_png_images(pdf_path, dpi=150)
-
-        # Rule 1 — must be exactly one page
-        if len(pages) > 1:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=(
-                    f"Invalid PDF: the file contains {len(pages)} pages. "
-                    "Only single-page invoices are accepted."
-                )
-            )
-
-        # Rule 2 — the page must not be blank
-        blank_flags = are_pdf_pages_blank(pdf_path, dpi=150)
-        if blank_flags[0]:
+        try:
+            check_pdf_structure(document, max_pages=MAX_PDF_PAGES)
+        except ValueError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid PDF: the first page is blank."
+                detail=str(e)
             )
 
     # def _convert_pdf_to_jpg_tmpfile(self, pdf_path: str) -> str:
@@ -280,17 +336,19 @@ class InvoiceProcessingAPI:
     #             detail=f"Data extraction failed: {str(e)}"
     #         )
 
-    def _extract_data(self, pdf_path: str) -> Dict[str, Any]:
+    def _extract_data(self, document: InvoiceDocument, timings: Optional[StageTimings] = None) -> Dict[str, Any]:
         """
         Extract data from invoice PDF.
         
         Args:
-            pdf_path (str): Path to the invoice PDF.
+            document (InvoiceDocument): The request's open invoice PDF.
+            timings (StageTimings, optional): Collects extract.* stage timings.
         ...
         """
         try:
-            client = PyMuPDFClient(pdf_path)
-            return client.extract_invoice_data()
+            timings = timings if timings is not None else StageTimings()
+            client = timings.call("extract.prepare", PyMuPDFClient, document, engine=EXTRACTION_ENGINE)
+            return client.extract_invoice_data(timings=timings)
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -369,80 +427,309 @@ class InvoiceProcessingAPI:
         
         return summary
     
-    def process_invoice(self, upload_file: UploadFile) -> Dict[str, Any]:
+    def process_pdf(self, source, filename: str = "", validate: bool = True,
+                    timings: Optional[StageTimings] = None) -> Dict[str, Any]:
         """
-        Complete invoice processing workflow.
-        
+        Run the CPU-bound part of the workflow on one PDF.
+
+        This is the unit of work handed to the executor (see run_pipeline),
+        so it takes and returns only plain, picklable values.
+
         Args:
-            upload_file (UploadFile): Uploaded invoice image file.
-        
+            source (bytes | str): Upload bytes, or the path of a downloaded PDF.
+            filename (str): Original filename, used in error messages.
+            validate (bool): Also validate the extracted data and summarise it.
+            timings (StageTimings, optional): Collects the stage timings.
+
         Returns:
-            dict: Complete response with extracted data, validation results, and summary.
-        
+            dict: extracted_data, plus validation_results and summary when
+            *validate* is set.
+
         Raises:
-            HTTPException: If any step of processing fails.
+            HTTPException 400: If the PDF cannot be opened or fails the
+                structural checks.
+            HTTPException 500: If extraction fails.
+            ValueError: If a downloaded file is not a readable PDF.
         """
-        pdf_tmp_path = None
-        # jpg_tmp_path = None
+        timings = timings if timings is not None else StageTimings()
+        with timings.stage("open"):
+            if isinstance(source, bytes):
+                document = self._open_pdf_bytes(source, filename)
+            else:
+                document = InvoiceDocument(source)
 
         try:
-            # Step 1 — basic file validation (type + size)
-            self._validate_file(upload_file)
+            timings.call("structure_check", self._validate_pdf_structure, document)
+            extracted_data = self._extract_data(document, timings)
+        finally:
+            document.close()
 
-            # Step 2 — persist the PDF to a temp file so we can inspect it
-            pdf_tmp_path = self._save_uploaded_file(upload_file)
+        if not validate:
+            return {"extracted_data": extracted_data}
+        return {"extracted_data": extracted_data, **self.validate_extracted(extracted_data, timings)}
 
-            # Step 3 — structural PDF validation (page count + blank check)
-            self._validate_pdf_structure(pdf_tmp_path)
+    def validate_extracted(self, extracted_data: Dict[str, Any],
+                           timings: Optional[StageTimings] = None) -> Dict[str, Any]:
+        """
+        Validate extracted data and summarise the outcome.
 
-            # # Step 4 — render the PDF page to a JPEG temp file
-            # jpg_tmp_path = self._convert_pdf_to_jpg_tmpfile(pdf_tmp_path)
+        Args:
+            extracted_data (dict): Extracted invoice data.
+            timings (StageTimings, optional): Collects the stage timings.
 
-            # # Step 5 — extract structured data from the JPEG via Gemini
-            # extracted_data = self._extract_data(jpg_tmp_path)
+        Returns:
+            dict: validation_results and summary.
+        """
+        timings = timings if timings is not None else StageTimings()
+        with timings.stage("validate"):
+            validation_results = self._validate_data(extracted_data)
+            summary = self._build_summary(validation_results)
+        return {"validation_results": validation_results, "summary": summary}
 
-            # Step 4 — extract structured data directly from the PDF
-            extracted_data = self._extract_data(pdf_tmp_path)
 
-            # Step 6 — validate extracted data
-            validation_results = self._validate_data(extracted_data)
+# Create API instance
+api_handler = InvoiceProcessingAPI()
 
-            # Step 7 — build summary + response
-            summary = self._build_summary(validation_results)
 
-            response = {
-                "status": "success",
-                "timestamp": datetime.utcnow().isoformat(),
-                "filename": upload_file.filename,
-                "summary": summary,
-                "extracted_data": extracted_data,
-                "validation_results": validation_results
-            }
+def run_pipeline(source, filename: str = "", validate: bool = True) -> Dict[str, Any]:
+    """
+    Executor entry point: run api_handler.process_pdf and report the outcome.
 
-            return response
+    Exceptions are turned into plain values so the outcome crosses a process
+    boundary intact, whichever exception type was raised.
 
-        except HTTPException:
-            # Re-raise HTTP exceptions (400 / 500) as-is
-            raise
-        except Exception as e:
-            # Catch any unexpected errors
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Unexpected error during processing: {str(e)}"
-            )
-        # finally:
-        #     # Always clean up both temp files, even if an exception occurred
-        #     for path in (pdf_tmp_path, jpg_tmp_path):
-        #         if path:
-        #             self._cleanup_temp_file(path)
+    Returns:
+        dict: {"result": ...} on success; otherwise {"status_code": ...,
+        "detail": ..., "error": ...}, where status_code is None for an
+        unexpected error and error is str() of the exception. Either way
+        "timings" holds the seconds spent in each stage.
+    """
+    timings = StageTimings()
+    try:
+        outcome = {"result": api_handler.process_pdf(source, filename, validate, timings)}
+    except HTTPException as e:
+        outcome = {"status_code": e.status_code, "detail": e.detail, "error": str(e)}
+    except Exception as e:
+        outcome = {"status_code": None, "detail": str(e), "error": str(e)}
+    outcome["timings"] = timings.seconds
+    return outcome
 
-        finally:
-            if pdf_tmp_path:
-                self._cleanup_temp_file(pdf_tmp_path)
+
+def init_worker():
+    """
+    Executor worker initializer: a worker process may extract long invoices
+    page-parallel (see InvoiceDocument.prefetch_pages). Worker threads may
+    not, as they share the server process with its other threads.
+    """
+    if EXECUTOR_KIND == "process":
+        enable_page_pool()
 
 
-# Create API instance
-api_handler = InvoiceProcessingAPI()
+def warm_up_worker():
+    """
+    Executor worker initializer: init_worker, then put a synthetic invoice
+    through run_pipeline once, so the first real invoice a fresh worker
+    gets is processed at steady-state speed.
+    """
+    init_worker()
+    run_pipeline(sample_invoice_pdf(), "warm-up.pdf")
+
+
+set_worker_initializer(init_worker)
+
+
+async def _read_upload(upload_file: UploadFile) -> bytes:
+    """Validate the upload (type + size) and read its body."""
+    api_handler._validate_file(upload_file)
+    try:
+        return await upload_file.read()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to read uploaded file: {str(e)}"
+        )
+
+
+async def _cached_result(content_hash: str, validate: bool, timings: StageTimings,
+                         compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Return a PDF's result from the result cache, producing what is missing.
+
+    Extraction and validation are separate entries: a PDF extracted before
+    without validation (by /extract-only) only needs validating.
+
+    Args:
+        content_hash (str): SHA-256 of the PDF.
+        validate (bool): Also return validation_results and summary.
+        timings (StageTimings): Collects the stage timings.
+        compute: Called when the extraction is not cached; returns what the
+            pipeline does for *validate*.
+
+    Returns:
+        dict: extracted_data, plus validation_results and summary when
+        *validate* is set.
+    """
+    result_cache = get_result_cache()
+    extraction_key = cache_key(content_hash, EXTRACTION_VERSION)
+    validation_key = cache_key(content_hash, VALIDATION_VERSION)
+    with timings.stage("cache_lookup"):
+        extraction = result_cache.get(extraction_key)
+        validation = result_cache.get(validation_key) if validate and extraction is not None else None
+
+    if extraction is None:
+        result = await compute()
+        with timings.stage("cache_store"):
+            result_cache.put(extraction_key, {"extracted_data": result["extracted_data"]})
+            if validate:
+                result_cache.put(validation_key, {
+                    "validation_results": result["validation_results"],
+                    "summary": result["summary"],
+                })
+        return result
+
+    if validate and validation is None:
+        validation = await asyncio.to_thread(api_handler.validate_extracted, extraction["extracted_data"], timings)
+        with timings.stage("cache_store"):
+            result_cache.put(validation_key, validation)
+    return {**extraction, **(validation or {})}
+
+
+async def _process_upload(content: bytes, filename: str, error_prefix: str,
+                          timings: Optional[StageTimings] = None, validate: bool = True) -> Dict[str, Any]:
+    """
+    Process an uploaded PDF on the executor, keeping the event loop free.
+
+    Results are cached by content (see _cached_result): an identical PDF is
+    answered from the cache without being processed again.
+
+    Args:
+        timings (StageTimings, optional): Collects the stage timings.
+        validate (bool): Also validate the extracted data and summarise it.
+
+    Returns:
+        dict: extracted_data, plus validation_results and summary when
+        *validate* is set.
+
+    Raises:
+        HTTPException: With the pipeline's own status, or 500 prefixed by
+            *error_prefix* for unexpected errors.
+    """
+    timings = timings if timings is not None else StageTimings()
+
+    async def process() -> Dict[str, Any]:
+        with timings.stage("executor"):
+            outcome = await run_in_executor(run_pipeline, content, filename, validate)
+        timings.merge(outcome.get("timings"))
+        if "result" in outcome:
+            return outcome["result"]
+        if outcome["status_code"] is not None:
+            raise HTTPException(status_code=outcome["status_code"], detail=outcome["detail"])
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"{error_prefix}: {outcome['detail']}"
+        )
+
+    return await _cached_result(hashlib.sha256(content).hexdigest(), validate, timings, process)
+
+
+async def _run_upload_pipeline(upload_file: UploadFile, error_prefix: str,
+                               timings: Optional[StageTimings] = None, validate: bool = True) -> Dict[str, Any]:
+    """Read an upload and process it (see _process_upload)."""
+    timings = timings if timings is not None else StageTimings()
+    with timings.stage("read_upload"):
+        content = await _read_upload(upload_file)
+    return await _process_upload(content, upload_file.filename, error_prefix, timings, validate)
+
+
+def _invoice_response(filename: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the /process-invoice response body for a processed upload."""
+    return {
+        "status": "success",
+        "timestamp": datetime.utcnow().isoformat(),
+        "filename": filename,
+        "summary": result["summary"],
+        "extracted_data": result["extracted_data"],
+        "validation_results": result["validation_results"]
+    }
+
+
+# ============================================================================
+# Background Jobs
+# ============================================================================
+
+async def _upload_job(params: dict, payload: bytes, progress) -> Dict[str, Any]:
+    """Job handler for a queued upload; returns the /process-invoice body."""
+    filename = params.get("filename", "")
+    progress(0, 1)
+    timings = StageTimings()
+    try:
+        # Shares the /process-invoice slots, so queued jobs cannot exceed them
+        async with cpu_admission.slot(retry=True):
+            result = await _process_upload(payload, filename, "Unexpected error during processing", timings)
+    except HTTPException as e:
+        raise JobError(e.status_code, e.detail)
+    finally:
+        record_stages("upload", timings)
+    progress(1)
+    return _invoice_response(filename, result)
+
+
+async def _batch_job(params: dict, payload: Optional[bytes], progress) -> Dict[str, Any]:
+    """Job handler for a queued GSPPI batch; returns the batch response body."""
+    try:
+        async with batch_admission.slot(retry=True):
+            return await _run_gsppi_batch(params.get("skip_unchanged", False), progress)
+    except HTTPException as e:
+        raise JobError(e.status_code, e.detail)
+
+
+job_store = JobStore()
+job_runner = JobRunner(job_store, {"upload": _upload_job, "batch": _batch_job})
+_warm_up_task = None
+
+
+@app.on_event("startup")
+async def _warm_up():
+    # Only server workers get here; the CLI and scripts importing this
+    # module keep the lazy imports.
+    global _warm_up_task
+    if not WARM_UP_ON_START:
+        return
+    # Imports and fork happen here, before the job runner or any other
+    # thread starts, so the workers inherit the imports and no held locks
+    seconds = warm_up(WARM_UP_MODULES)
+    if EXECUTOR_PRESTART:
+        # Also warms up a pool started again after a worker died
+        set_worker_initializer(warm_up_worker)
+        start_executor()
+    # The workers warm up in the background; /health reports 503 meanwhile
+    _warm_up_task = asyncio.create_task(_finish_warm_up(seconds))
+
+
+async def _finish_warm_up(seconds: float):
+    try:
+        if EXECUTOR_PRESTART:
+            seconds += await asyncio.to_thread(wait_for_workers)
+        print(f"Warmed up in {seconds:.2f}s")
+    except Exception as e:
+        # Still serve: requests work, the first ones are just slower
+        warm_up_state["error"] = str(e)
+        print(f"Warning: Warm-up failed: {e}")
+    warm_up_state["ready"] = True
+
+
+@app.on_event("startup")
+async def _start_jobs():
+    await job_runner.start(recover=JOB_RECOVER_ON_START)
+
+
+@app.on_event("shutdown")
+async def _release_pools():
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+    await job_runner.stop()
+    shutdown_executor()
+    close_session()
 
 
 # ============================================================================
@@ -464,6 +751,9 @@ async def root():
         "endpoints": {
             "health": "/health",
             "process_invoice": "/process-invoice (POST)",
+            "process_invoices": "/process-invoices (POST)",
+            "metrics": "/metrics",
+            "jobs": "/jobs (POST), /jobs/{job_id}, /jobs/{job_id}/result",
             "docs": "/docs",
             "redoc": "/redoc"
         },
@@ -477,8 +767,19 @@ async def health_check():
     Health check endpoint.
     
     Returns:
-        dict: API health status and system information.
+        dict: API health status and system information; 503 with status
+        'starting' until the startup warm-up has finished.
     """
+    if not warm_up_state["ready"]:
+        return FastJSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={
+                "status": "starting",
+                "detail": "Warming up; not ready for traffic yet.",
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        )
+
     # try:
     #     # Check if required environment variables are set
     #     api_key_set = os.getenv("GEMINI_API_KEY") is not None
@@ -513,10 +814,17 @@ async def health_check():
             "dependencies": {
                 "gemini_client": "available",
                 "validator": "available"
-            }
+            },
+            "executor": executor_info(),
+            "http_pool": pool_stats(),
+            "result_cache": get_result_cache().stats(),
+            "jobs": job_store.counts(),
+            "admission": {c.name: c.stats() for c in (cpu_admission, batch_admission)},
+            "json_encoder": ACTIVE_ENCODER,
+            "warm_up": warm_up_state
         }
     except Exception as e:
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             content={
                 "status": "unhealthy",
@@ -526,8 +834,39 @@ async def health_check():
         )
 
 
+@app.get("/metrics", tags=["General"], response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Prometheus metrics for this worker process.
+
+    Per-stage latency histograms (invoice_stage_seconds, by pipeline and
+    stage) and admission wait histograms, followed by gauges and counters
+    for the executor, admission queues, result cache, HTTP pool and jobs.
+
+    Returns:
+        str: Prometheus text exposition format (version 0.0.4).
+    """
+    content = render_metrics(
+        gauges={
+            "invoice_executor": executor_info(),
+            "invoice_http_pool": pool_stats(),
+            "invoice_result_cache": get_result_cache().stats(),
+        },
+        labelled_gauges={
+            "invoice_admission": {"group": {c.name: c.stats() for c in (cpu_admission, batch_admission)}},
+            "invoice_jobs": {"status": {name: {"count": n} for name, n in job_store.counts().items()}},
+        },
+        counters={
+            "invoice_executor": ("completed", "failed"),
+            "invoice_result_cache": ("memory_hits", "disk_hits", "misses", "evictions"),
+            "invoice_admission": ("admitted", "rejected_queue_full", "rejected_timeout"),
+        },
+    )
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4")
+
+
 @app.post("/process-invoice", tags=["Invoice Processing"])
-async def process_invoice_endpoint(file: UploadFile = File(...)):
+async def process_invoice_endpoint(file: UploadFile = File(...), debug: bool = False):
     """
     Process an invoice image and return extracted data with validation results.
     
@@ -538,6 +877,9 @@ async def process_invoice_endpoint(file: UploadFile = File(...)):
         file (UploadFile): The invoice PDF file to process.
                           Supported format: PDF (.pdf)
                           Max size: 10 MB
+        debug (bool): Query parameter (default false). Add timings_ms, the
+                      time spent in each stage so far (JSON encoding
+                      excluded), to the response.
     
     Returns:
         dict: JSON response containing:
@@ -575,9 +917,14 @@ async def process_invoice_endpoint(file: UploadFile = File(...)):
             }
         }
     """
+    timings = StageTimings()
     try:
-        result = api_handler.process_invoice(file)
-        return JSONResponse(content=result, status_code=status.HTTP_200_OK)
+        result = await _run_upload_pipeline(file, "Unexpected error during processing", timings)
+        response = _invoice_response(file.filename, result)
+        if debug:
+            response["timings_ms"] = timings.as_ms()
+        with timings.stage("encode"):
+            return FastJSONResponse(content=response, status_code=status.HTTP_200_OK)
     except HTTPException:
         raise
     except Exception as e:
@@ -585,10 +932,12 @@ async def process_invoice_endpoint(file: UploadFile = File(...)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
+    finally:
+        record_stages("upload", timings)
 
 
 @app.post("/extract-only", tags=["Invoice Processing"])
-async def extract_only_endpoint(file: UploadFile = File(...)):
+async def extract_only_endpoint(file: UploadFile = File(...), debug: bool = False):
     """
     Extract data from invoice without validation.
     
@@ -597,6 +946,8 @@ async def extract_only_endpoint(file: UploadFile = File(...)):
     
     Args:
         file (UploadFile): The invoice PDF file to process.
+        debug (bool): Query parameter (default false). Add per-stage
+            timings_ms to the response, as for /process-invoice.
     
     Returns:
         dict: JSON response with extracted data only.
@@ -613,37 +964,23 @@ async def extract_only_endpoint(file: UploadFile = File(...)):
             }
         }
     """
-    pdf_tmp_path = None
-    # jpg_tmp_path = None
-
+    timings = StageTimings()
     try:
-        # Step 1 — basic file validation (type + size)
-        api_handler._validate_file(file)
-
-        # Step 2 — persist the PDF to a temp file
-        pdf_tmp_path = api_handler._save_uploaded_file(file)
-
-        # Step 3 — structural PDF validation (page count + blank check)
-        api_handler._validate_pdf_structure(pdf_tmp_path)
-
-        # # Step 4 — render the PDF page to a JPEG temp file
-        # jpg_tmp_path = api_handler._convert_pdf_to_jpg_tmpfile(pdf_tmp_path)
-
-        # # Step 5 — extract structured data from the JPEG via Gemini
-        # extracted_data = api_handler._extract_data(jpg_tmp_path)
-
-        # Step 4 — extract structured data directly from the PDF
-        extracted_data = api_handler._extract_data(pdf_tmp_path)
+        # Steps 1-4 — file checks, open, structural checks, extraction
+        result = await _run_upload_pipeline(file, "Extraction failed", timings, validate=False)
 
         # Build response
         response = {
             "status": "success",
             "timestamp": datetime.utcnow().isoformat(),
             "filename": file.filename,
-            "extracted_data": extracted_data
+            "extracted_data": result["extracted_data"]
         }
+        if debug:
+            response["timings_ms"] = timings.as_ms()
 
-        return JSONResponse(content=response, status_code=status.HTTP_200_OK)
+        with timings.stage("encode"):
+            return FastJSONResponse(content=response, status_code=status.HTTP_200_OK)
 
     except HTTPException:
         raise
@@ -652,19 +989,488 @@ async def extract_only_endpoint(file: UploadFile = File(...)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Extraction failed: {str(e)}"
         )
-    # finally:
-    #     # Always clean up both temp files
-    #     for path in (pdf_tmp_path, jpg_tmp_path):
-    #         if path:
-    #             api_handler._cleanup_temp_file(path)
+    finally:
+        record_stages("upload", timings)
+
+
+async def _process_gsppi_invoice(invoice: Dict[str, Any], skip_unchanged: bool = False,
+                                 debug: bool = False) -> Dict[str, Any]:
+    """
+    Download, process and log one invoice from a GSPPI batch.
+
+    The invoice's outcome is written to the processed log as soon as it is
+    known. An invoice taking longer than BATCH_INVOICE_TIMEOUT seconds is
+    recorded as failed.
 
+    With *skip_unchanged*, an invoice last processed successfully from the
+    same URL is fetched conditionally. If the server answers 304, or the
+    body hashes the same as before, the stored result is returned (marked
+    ``"cached": true``) without processing the PDF again.
+
+    Args:
+        invoice (dict): One entry of the GSPPI invoice list.
+        skip_unchanged (bool): Reuse results for unchanged PDFs.
+        debug (bool): Add timings_ms, the time spent in each stage, to the
+            entry.
+
+    Returns:
+        dict: The invoice's entry for the batch response.
+    """
+    timings = StageTimings()
+    try:
+        with timings.stage("total"):
+            entry = await _run_gsppi_invoice(invoice, skip_unchanged, timings)
     finally:
-            if pdf_tmp_path:
-                api_handler._cleanup_temp_file(pdf_tmp_path)
+        record_stages("gsppi", timings)
+    if debug:
+        entry["timings_ms"] = timings.as_ms()
+    return entry
+
+
+async def _write_processed_log(bill_id: str, status: str, **fields):
+    """update_processed_log on the log-writer thread; see _log_writer."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_log_writer, partial(update_processed_log, bill_id, status, **fields))
+
+
+async def _fetch_pdf(url: str, etag: Optional[str], last_modified: Optional[str]) -> PdfDownload:
+    """
+    fetch_pdf on a worker thread.
+
+    A cancelled caller (the batch timeout) cannot stop the thread, so the
+    download finishes in the background; its temp file, if any, is then
+    deleted instead of being left behind.
+    """
+    future = asyncio.get_running_loop().run_in_executor(None, fetch_pdf, url, etag, last_modified)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(_discard_download)
+        raise
+
+
+def _discard_download(future: asyncio.Future):
+    """Delete the temp file of a download nobody is waiting for any more."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    download = future.result()
+    if isinstance(download.source, str):
+        api_handler._cleanup_temp_file(download.source)
+
+
+async def _run_gsppi_invoice(invoice: Dict[str, Any], skip_unchanged: bool,
+                             timings: StageTimings) -> Dict[str, Any]:
+    """The body of _process_gsppi_invoice, timing each stage into *timings*."""
+    bill_id = invoice.get("BillID", "")
+    url = invoice.get("Url", "")
+    doc_type = invoice.get("DocType", "")
+
+    previous = None
+    if skip_unchanged and url:
+        with timings.stage("log_lookup"):
+            previous = get_processed_log().get_unchanged_candidate(bill_id, url)
+
+    async def download_and_process():
+        download = None
+        try:
+            # Step 2 — stream the PDF into memory, or a temp file if it is
+            # large (network I/O, off the loop); conditional when a previous
+            # result could be reused
+            with timings.stage("download"):
+                download = await _fetch_pdf(
+                    url,
+                    previous["etag"] if previous else None,
+                    previous["last_modified"] if previous else None,
+                )
+            if previous and (download.not_modified or download.content_hash == previous["content_hash"]):
+                return download, None
+
+            # Steps 3-7 — structural checks, extraction, validation, summary,
+            # unless this exact PDF was processed before
+            async def process() -> Dict[str, Any]:
+                with timings.stage("executor"):
+                    outcome = await run_in_executor(run_pipeline, download.source, url)
+                timings.merge(outcome.get("timings"))
+                if "result" not in outcome:
+                    raise RuntimeError(outcome["error"])
+                return outcome["result"]
+
+            result = await _cached_result(download.content_hash, True, timings, process)
+            return download, {
+                "extracted_data": result["extracted_data"],
+                "validation_results": result["validation_results"],
+                "validation_summary": result["summary"]
+            }
+        finally:
+            if download is not None and isinstance(download.source, str):
+                api_handler._cleanup_temp_file(download.source)
+
+    try:
+        try:
+            download, result = await asyncio.wait_for(download_and_process(), BATCH_INVOICE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Processing timed out after {BATCH_INVOICE_TIMEOUT:g} seconds")
+
+        content_hash, etag, last_modified = download.content_hash, download.etag, download.last_modified
+        cached = result is None
+        if cached:
+            # Unchanged since the last success: keep its result, and its
+            # hash and validators where this response did not resend them
+            result = previous["result"]
+            content_hash = previous["content_hash"]
+            etag = etag or previous["etag"]
+            last_modified = last_modified or previous["last_modified"]
+
+        # Step 8 — write success to log
+        with timings.stage("log_write"):
+            await _write_processed_log(
+                bill_id, "success", url=url, doc_type=doc_type,
+                content_hash=content_hash, etag=etag, last_modified=last_modified,
+                result=result,
+            )
+
+        entry = {
+            "bill_id": bill_id,
+            "doc_type": doc_type,
+            "url": url,
+            "status": "success",
+            **result
+        }
+        if cached:
+            entry["cached"] = True
+        return entry
+
+    except Exception as e:
+        error_message = str(e)
+
+        # Write failure to log, overwriting any previous entry for this BillID
+        with timings.stage("log_write"):
+            await _write_processed_log(bill_id, "failed", url=url, doc_type=doc_type, error=error_message)
+
+        return {
+            "bill_id": bill_id,
+            "doc_type": doc_type,
+            "url": url,
+            "status": "failed",
+            "error": error_message
+        }
+
+
+async def _fetch_gsppi_invoices() -> List[dict]:
+    """
+    Step 1 — fetch the full invoice list from the client API.
+
+    Raises:
+        HTTPException 500: If the GSPPI API itself cannot be reached.
+    """
+    timings = StageTimings()
+    try:
+        with timings.stage("fetch_list"):
+            return await asyncio.to_thread(fetch_digital_invoices)
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch invoices from GSPPI API: {str(e)}"
+        )
+    finally:
+        record_stages("gsppi", timings)
+
+
+def _group_by_bill_id(invoice_list: List[dict]) -> Dict[str, List[dict]]:
+    # Invoices sharing a BillID run in list order, so the latest one wins
+    groups = {}
+    for invoice in invoice_list:
+        groups.setdefault(invoice.get("BillID", ""), []).append(invoice)
+    return groups
+
+
+def _batch_summary(total: int, succeeded: int, failed: int) -> Dict[str, Any]:
+    return {
+        "status": "success",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "summary": {
+            "total_fetched": total,
+            "succeeded": succeeded,
+            "failed": failed
+        }
+    }
+
+
+async def _run_gsppi_batch(skip_unchanged: bool = False,
+                           progress: Optional[Callable[..., None]] = None,
+                           debug: bool = False) -> Dict[str, Any]:
+    """
+    Fetch the GSPPI invoice list and process every invoice on it.
+
+    Args:
+        skip_unchanged (bool): See process_invoices_from_api_endpoint.
+        progress (callable, optional): Called as ``progress(0, total)``
+            once the list is fetched, then ``progress(done)`` as each
+            invoice finishes.
+        debug (bool): Add per-stage timings_ms to every invoice's entry.
+
+    Returns:
+        dict: The batch response body.
+
+    Raises:
+        HTTPException 500: If the GSPPI API itself cannot be reached.
+    """
+    invoice_list = await _fetch_gsppi_invoices()
+
+    # Steps 2-8 run for up to BATCH_MAX_IN_FLIGHT invoices at once, so
+    # downloads overlap with extraction on the executor
+    groups = _group_by_bill_id(invoice_list)
+
+    semaphore = asyncio.Semaphore(BATCH_MAX_IN_FLIGHT)
+    done = 0
+    if progress is not None:
+        progress(0, len(invoice_list))
+
+    async def process_group(invoices):
+        nonlocal done
+        outcomes = []
+        for invoice in invoices:
+            async with semaphore:
+                outcomes.append(await _process_gsppi_invoice(invoice, skip_unchanged, debug))
+            done += 1
+            if progress is not None:
+                progress(done)
+        return outcomes
+
+    grouped = await asyncio.gather(*(process_group(g) for g in groups.values()))
+
+    results = {}
+    succeeded = 0
+    failed = 0
+
+    for bill_id, outcomes in zip(groups, grouped):
+        results[bill_id] = outcomes[-1]
+        for outcome in outcomes:
+            if outcome["status"] == "success":
+                succeeded += 1
+            else:
+                failed += 1
+
+    response = _batch_summary(len(invoice_list), succeeded, failed)
+    response["results"] = results
+    return response
+
+
+def _ndjson_line(content: Any) -> bytes:
+    # Same encoding as the JSON responses, one object per line
+    return dumps(content) + b"\n"
+
+
+async def _stream_gsppi_batch(invoice_list: List[dict], skip_unchanged: bool = False,
+                              debug: bool = False) -> AsyncIterator[bytes]:
+    """
+    Process a fetched invoice list, yielding one NDJSON line per invoice as
+    it finishes, then a summary line.
+
+    Nothing is accumulated: each outcome is written out and dropped, and
+    workers wait (through a queue of BATCH_MAX_IN_FLIGHT) while the client
+    is slower to read than they are to produce, so memory stays flat
+    whatever the batch size. If the client disconnects, the remaining
+    invoices are cancelled.
+    """
+    groups = _group_by_bill_id(invoice_list)
+    semaphore = asyncio.Semaphore(BATCH_MAX_IN_FLIGHT)
+    queue = asyncio.Queue(maxsize=BATCH_MAX_IN_FLIGHT)
+
+    async def process_group(invoices):
+        try:
+            for invoice in invoices:
+                async with semaphore:
+                    outcome = await _process_gsppi_invoice(invoice, skip_unchanged, debug)
+                await queue.put(outcome)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(None)  # Group finished
+
+    tasks = [asyncio.create_task(process_group(g)) for g in groups.values()]
+    succeeded = failed = 0
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if item is None:
+                remaining -= 1
+                continue
+            if isinstance(item, Exception):
+                raise item  # Ends the stream without a summary line
+            if item["status"] == "success":
+                succeeded += 1
+            else:
+                failed += 1
+            yield _ndjson_line(item)
+
+        yield _ndjson_line(_batch_summary(len(invoice_list), succeeded, failed))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _iter_uploaded_invoices(request: Request) -> AsyncIterator[UploadedFile]:
+    """
+    Yield every file of a multi-file upload as it arrives, expanding zip
+    archives. The body and all archive members share one byte and file
+    budget (MAX_UPLOAD_TOTAL_BYTES, MAX_UPLOAD_FILES).
+    """
+    budget = UploadBudget(MAX_UPLOAD_TOTAL_BYTES, MAX_UPLOAD_FILES)
+    uploads = read_multipart(
+        request.headers.get("content-type", ""), request.stream(), MAX_UPLOAD_FILE_BYTES, budget
+    )
+    async for upload in uploads:
+        if upload.is_zip and upload.error is None:
+            members = await asyncio.to_thread(expand_zip, upload, MAX_UPLOAD_FILE_BYTES, budget)
+            for member in members:
+                yield member
+        else:
+            yield upload
+
+
+async def _process_uploaded_invoice(upload: UploadedFile, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """
+    Process one file of a multi-file upload.
+
+    Returns:
+        dict: The /process-invoice response body on success; otherwise
+        status 'failed', filename, status_code and error.
+    """
+    timings = StageTimings()
+    try:
+        if upload.error is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=upload.error)
+        file_extension = os.path.splitext(upload.filename)[1].lower()
+        if file_extension != ".pdf":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid file type '{file_extension}'. Only PDF files (.pdf) are accepted."
+            )
+        async with semaphore:
+            result = await _process_upload(upload.data, upload.filename, "Unexpected error during processing", timings)
+        return _invoice_response(upload.filename, result)
+
+    except HTTPException as e:
+        status_code, error = e.status_code, e.detail
+    except Exception as e:
+        status_code, error = status.HTTP_500_INTERNAL_SERVER_ERROR, f"Unexpected error during processing: {str(e)}"
+    finally:
+        upload.data = None  # Done with the bytes
+        record_stages("upload", timings)
+
+    return {
+        "status": "failed",
+        "filename": upload.filename,
+        "status_code": status_code,
+        "error": error
+    }
+
+
+def _files_summary(total: int, succeeded: int, failed: int) -> Dict[str, Any]:
+    return {
+        "status": "success",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "summary": {
+            "total_files": total,
+            "succeeded": succeeded,
+            "failed": failed
+        }
+    }
+
+
+async def _stream_uploaded_invoices(tasks: List[asyncio.Task]) -> AsyncIterator[bytes]:
+    """Yield one NDJSON line per file as it finishes, then a summary line."""
+    succeeded = failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            entry = await next_done
+            if entry["status"] == "success":
+                succeeded += 1
+            else:
+                failed += 1
+            yield _ndjson_line(entry)
+
+        yield _ndjson_line(_files_summary(len(tasks), succeeded, failed))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/process-invoices", tags=["Invoice Processing"])
+async def process_invoices_endpoint(request: Request, stream: bool = False):
+    """
+    Process many invoice PDFs sent in one multipart/form-data request.
+
+    Send any number of file fields (any field name), each a PDF or a zip
+    archive of PDFs. Files are processed in parallel on the worker pool
+    (up to BATCH_MAX_IN_FLIGHT at once), starting as soon as each one has
+    arrived rather than after the whole upload.
+
+    Limits are enforced while the body is read: a file over 10 MB is
+    reported as failed without being buffered, and a body over
+    MAX_UPLOAD_TOTAL_BYTES, or more than MAX_UPLOAD_FILES files, is
+    rejected at once. Zip members count toward both limits: the body plus
+    the uncompressed members of every archive share MAX_UPLOAD_TOTAL_BYTES.
+
+    Example:
+        curl -X POST http://localhost:8000/process-invoices \
+             -F "files=@invoice_001.pdf" -F "files=@invoice_002.pdf" \
+             -F "files=@march.zip"
+
+    Args:
+        stream (bool): Query parameter (default false). Respond with NDJSON
+            (application/x-ndjson): one line per file as soon as it
+            finishes, then a final line with status, timestamp and summary.
+
+    Returns:
+        dict: JSON response containing:
+            - status (str): 'success' (even if some files failed individually)
+            - timestamp (str): UTC timestamp of the run
+            - summary (dict): Counts of total_files, succeeded, failed
+            - results (list): One entry per file, in upload order (zip
+              members as '<archive>/<member>'): the /process-invoice
+              response on success, or status 'failed' with filename,
+              status_code and error.
+
+    Raises:
+        HTTPException 400: If the body is not multipart/form-data or holds
+            no files.
+        HTTPException 413: If the body or file count exceeds its limit.
+    """
+    semaphore = asyncio.Semaphore(BATCH_MAX_IN_FLIGHT)
+    tasks = []
+    try:
+        async for upload in _iter_uploaded_invoices(request):
+            if len(tasks) >= MAX_UPLOAD_FILES:
+                raise UploadTooLarge(f"Too many files; at most {MAX_UPLOAD_FILES} are accepted per request.")
+            tasks.append(asyncio.create_task(_process_uploaded_invoice(upload, semaphore)))
+    except BaseException as e:
+        for task in tasks:
+            task.cancel()
+        if isinstance(e, UploadTooLarge):
+            raise HTTPException(status_code=413, detail=str(e))
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        raise
+
+    if not tasks:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No files provided")
+
+    if stream:
+        return StreamingResponse(_stream_uploaded_invoices(tasks), media_type="application/x-ndjson")
+
+    results = await asyncio.gather(*tasks)
+    succeeded = sum(1 for entry in results if entry["status"] == "success")
+    response = _files_summary(len(results), succeeded, len(results) - succeeded)
+    response["results"] = results
+    return StreamingJSONResponse(content=response, status_code=status.HTTP_200_OK)
 
 
 @app.post("/process-invoices-from-api", tags=["Invoice Processing"])
-async def process_invoices_from_api_endpoint():
+async def process_invoices_from_api_endpoint(skip_unchanged: bool = BATCH_SKIP_UNCHANGED, stream: bool = False,
+                                             debug: bool = False):
     """
     Fetch invoices from the client's GSPPI API and process all of them.
 
@@ -672,6 +1478,23 @@ async def process_invoices_from_api_endpoint():
     The client controls the API response — successfully processed invoices
     are removed by the client, and failed ones are fixed and resent.
 
+    Up to BATCH_MAX_IN_FLIGHT invoices are processed concurrently, each
+    limited to BATCH_INVOICE_TIMEOUT seconds.
+
+    Args:
+        skip_unchanged (bool): Query parameter (default BATCH_SKIP_UNCHANGED).
+            Return the stored result for an invoice whose PDF has not changed
+            since it was last processed successfully, instead of processing
+            it again.
+        stream (bool): Query parameter (default false). Respond with NDJSON
+            (application/x-ndjson) instead: one line per invoice, in the
+            per-invoice format below, written as soon as it finishes, then
+            a final line with status, timestamp and summary. Server memory
+            stays flat whatever the batch size. Every invoice gets a line,
+            including earlier ones for a repeated BillID.
+        debug (bool): Query parameter (default false). Add timings_ms, the
+            time spent in each stage, to every invoice's entry.
+
     Each invoice's outcome is written to the processed log immediately after
     processing. If a BillID already exists in the log (previously failed and
     resent by the client), its entry is overwritten with the latest outcome.
@@ -690,105 +1513,113 @@ async def process_invoices_from_api_endpoint():
                 - extracted_data (dict, optional): present only on success
                 - validation_results (dict, optional): present only on success
                 - validation_summary (dict, optional): present only on success
+                - cached (bool, optional): true when the result was reused
+                  for an unchanged PDF
 
     Raises:
         HTTPException 500: If the GSPPI API itself cannot be reached.
     """
-    # Step 1 — fetch the full invoice list from the client API
-    try:
-        invoice_list = fetch_digital_invoices()
-    except RuntimeError as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to fetch invoices from GSPPI API: {str(e)}"
+    if stream:
+        # Fetch first, so an unreachable GSPPI API is still a plain 500
+        invoice_list = await _fetch_gsppi_invoices()
+        return StreamingResponse(
+            _stream_gsppi_batch(invoice_list, skip_unchanged, debug),
+            media_type="application/x-ndjson"
         )
 
-    results = {}
-    succeeded = 0
-    failed = 0
+    content = await _run_gsppi_batch(skip_unchanged, debug=debug)
+    return StreamingJSONResponse(content=content, status_code=status.HTTP_200_OK)
 
-    for invoice in invoice_list:
-        bill_id = invoice.get("BillID", "")
-        url = invoice.get("Url", "")
-        doc_type = invoice.get("DocType", "")
 
-        pdf_tmp_path = None
-        # jpg_tmp_path = None
+@app.post("/jobs", status_code=status.HTTP_202_ACCEPTED, tags=["Jobs"])
+async def submit_job(file: Optional[UploadFile] = File(None), batch: bool = False,
+                     skip_unchanged: bool = BATCH_SKIP_UNCHANGED):
+    """
+    Queue an upload or a GSPPI batch and return at once.
 
-        try:
-            # Step 2 — download the PDF to a temp file
-            pdf_tmp_path = download_pdf_from_url(url)
+    Send either a PDF as ``file`` (processed like /process-invoice) or
+    ``batch=true`` (processed like /process-invoices-from-api, honouring
+    ``skip_unchanged``). Queued jobs are stored, so they survive a restart.
+
+    Jobs run JOB_WORKERS at a time per process, and each holds a slot of
+    the /process-invoice (or batch) admission limit while it runs, so work
+    sent here shares those limits; instead of a 429 it waits in the queue.
 
-            # Step 3 — structural PDF validation (page count + blank check)
-            api_handler._validate_pdf_structure(pdf_tmp_path)
+    Returns:
+        dict: 202 response with job_id, status ('queued') and the URLs to
+        poll for status and fetch the result.
 
-            # # Step 4 — render to JPEG for Gemini
-            # jpg_tmp_path = api_handler._convert_pdf_to_jpg_tmpfile(pdf_tmp_path)
+    Raises:
+        HTTPException 400: If neither a file nor batch=true is given, or the
+            file is not a PDF or exceeds 10 MB.
+    """
+    if file is not None:
+        payload = await _read_upload(file)
+        job_id = await asyncio.to_thread(job_store.submit, "upload", {"filename": file.filename}, payload)
+    elif batch:
+        job_id = await asyncio.to_thread(job_store.submit, "batch", {"skip_unchanged": skip_unchanged})
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Send a PDF file, or batch=true to process the GSPPI invoice list."
+        )
+    job_runner.notify()
 
-            # # Step 5 — extract structured data via Gemini
-            # extracted_data = api_handler._extract_data(jpg_tmp_path)
+    return FastJSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Location": f"/jobs/{job_id}"},
+        content={
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "result_url": f"/jobs/{job_id}/result"
+        }
+    )
 
-            # Step 4 — extract structured data directly from the PDF
-            extracted_data = api_handler._extract_data(pdf_tmp_path)
 
-            # Step 6 — validate extracted data
-            validation_results = api_handler._validate_data(extracted_data)
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+async def get_job(job_id: str):
+    """
+    Report a job's status and progress.
 
-            # Step 7 — build summary
-            validation_summary = api_handler._build_summary(validation_results)
+    Returns:
+        dict: id, kind, status ('queued', 'running', 'succeeded' or
+        'failed'), params, progress {done, total}, error, error_status and
+        timestamps.
 
-            # Step 8 — write success to log
-            update_processed_log(bill_id, status="success", url=url, doc_type=doc_type)
+    Raises:
+        HTTPException 404: If the job does not exist (or was purged).
+    """
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job '{job_id}' not found")
+    return job
 
-            succeeded += 1
-            results[bill_id] = {
-                "bill_id": bill_id,
-                "doc_type": doc_type,
-                "url": url,
-                "status": "success",
-                "extracted_data": extracted_data,
-                "validation_results": validation_results,
-                "validation_summary": validation_summary
-            }
 
-        except Exception as e:
-            error_message = str(e)
-
-            # Write failure to log, overwriting any previous entry for this BillID
-            update_processed_log(bill_id, status="failed", url=url, doc_type=doc_type, error=error_message)
-
-            failed += 1
-            results[bill_id] = {
-                "bill_id": bill_id,
-                "doc_type": doc_type,
-                "url": url,
-                "status": "failed",
-                "error": error_message
-            }
+@app.get("/jobs/{job_id}/result", tags=["Jobs"])
+async def get_job_result(job_id: str):
+    """
+    Return a finished job's result.
 
-        # finally:
-        #     # Always clean up temp files for this invoice
-        #     for path in (pdf_tmp_path, jpg_tmp_path):
-        #         if path:
-        #             api_handler._cleanup_temp_file(path)
+    A succeeded job returns the same body as the synchronous endpoint; a
+    failed one returns that endpoint's error status and detail.
 
-        finally:
-            if pdf_tmp_path:
-                api_handler._cleanup_temp_file(pdf_tmp_path)
+    Raises:
+        HTTPException 404: If the job does not exist (or was purged).
+        HTTPException 409: If the job has not finished yet.
+    """
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job '{job_id}' not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=job["error_status"] or 500, detail=job["error"])
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job '{job_id}' is {job['status']}")
 
-    return JSONResponse(
-        content={
-            "status": "success",
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "summary": {
-                "total_fetched": len(invoice_list),
-                "succeeded": succeeded,
-                "failed": failed
-            },
-            "results": results
-        },
-        status_code=status.HTTP_200_OK
-    )
+    result = await asyncio.to_thread(job_store.get_result, job_id)
+    if job["kind"] == "batch":
+        return StreamingJSONResponse(content=result, status_code=status.HTTP_200_OK)
+    return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
 
 
 @app.exception_handler(Exception)
@@ -801,9 +1632,9 @@ async def global_exception_handler(request, exc):
         exc: The exception that was raised.
     
     Returns:
-        JSONResponse: Error response with details.
+        FastJSONResponse: Error response with details.
     """
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={
             "status": "error",
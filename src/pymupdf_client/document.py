@@ -0,0 +1,293 @@
+"""
+Invoice Document Module
+
+This module provides InvoiceDocument, a per-request view of an invoice PDF.
+The PDF is opened exactly once and every derived artifact (page count, text,
+words, images, drawings, rendered pixmaps) is computed lazily on first use and cached,
+so that structural validation, extraction and rendering share their work.
+Text, blocks and words of a page all come from one cached TextPage. Long
+documents can have every page's text layer extracted up front by a pool of
+worker processes (PyMuPDF itself is not thread-safe).
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from helper import BLANK_CHECK_DPI, is_page_blank, render_page
+
+
+# Documents with at least this many pages are extracted page-parallel
+PARALLEL_MIN_PAGES = int(os.getenv("PARALLEL_MIN_PAGES", "8"))
+PAGE_WORKERS = int(os.getenv("PAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Whether prefetch_pages may start a page pool in this process; see
+# enable_page_pool
+_page_pool_enabled = False
+
+
+def enable_page_pool() -> None:
+    """
+    Let prefetch_pages extract long documents page-parallel in this process.
+
+    Opt-in, because the pool forks its workers, which copy the process as
+    it is: call it only where no other thread can hold a lock at that
+    moment, e.g. a CLI, or a process-pool executor worker (not a thread in
+    a server).
+    """
+    global _page_pool_enabled
+    _page_pool_enabled = True
+
+
+def _extract_pages(source: "str | bytes", page_numbers: list, layout: bool) -> dict:
+    """
+    Worker: extract the text layer of some pages of a PDF.
+
+    Args:
+        source (str | bytes): Path to the PDF or its raw bytes.
+        page_numbers (list): Pages to extract.
+        layout (bool): Also extract words and vector drawings.
+
+    Returns:
+        dict: Page number -> ``(blocks, words, drawings)``; words and
+        drawings are None unless *layout* is set.
+    """
+    if isinstance(source, bytes):
+        doc = fitz.open(stream=source, filetype="pdf")
+    else:
+        doc = fitz.open(source)
+    try:
+        pages = {}
+        for page_no in page_numbers:
+            page = doc[page_no]
+            textpage = page.get_textpage()
+            pages[page_no] = (
+                page.get_text("blocks", textpage=textpage),
+                page.get_text("words", textpage=textpage) if layout else None,
+                page.get_drawings() if layout else None,
+            )
+        return pages
+    finally:
+        doc.close()
+
+
+class InvoiceDocument:
+    """
+    An open invoice PDF plus lazily cached artifacts derived from it.
+
+    Attributes:
+        name (str): File name or path the document came from (may be empty).
+        data (bytes | None): The raw PDF bytes when opened from memory.
+        doc (fitz.Document): The underlying PyMuPDF document.
+
+    Example:
+        >>> with InvoiceDocument("invoice.pdf") as document:
+        ...     print(document.page_count, len(document.words(0)))
+    """
+
+    def __init__(self, source: "str | bytes | fitz.Document", name: str = ""):
+        """
+        Open the invoice PDF.
+
+        Args:
+            source (str | bytes | fitz.Document): Path to the PDF, the raw PDF
+                bytes, or an already-open document. An open document is used
+                as-is and stays owned by the caller.
+            name (str): Display name, e.g. the uploaded file name. Defaults to
+                the path (or the document's own name).
+
+        Raises:
+            ValueError: If the source cannot be opened as a PDF.
+        """
+        self.data = None
+        self._owns_doc = True
+
+        try:
+            if isinstance(source, fitz.Document):
+                self.doc = source
+                self._owns_doc = False
+            elif isinstance(source, (bytes, bytearray, memoryview)):
+                self.data = bytes(source)
+                self.doc = fitz.open(stream=self.data, filetype="pdf")
+            else:
+                self.doc = fitz.open(source)
+        except fitz.FileDataError as e:
+            raise ValueError(f"Invalid PDF: the file could not be opened ({str(e)}).")
+
+        self.name = name or self.doc.name or ""
+
+        self._page_count = None
+        self._text = None
+        self._pages = {}
+        self._textpages = {}
+        self._page_text = {}
+        self._blocks = {}
+        self._words = {}
+        self._images = {}
+        self._drawings = {}
+        self._pixmaps = {}
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def close(self):
+        """Drop cached artifacts and close the document if we opened it."""
+        self._pixmaps.clear()
+        self._textpages.clear()
+        self._pages.clear()
+        if self._owns_doc and not self.doc.is_closed:
+            self.doc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def prefetch_pages(self, layout: bool = False) -> None:
+        """
+        Extract every page's text layer up front, in parallel.
+
+        Does nothing for documents shorter than PARALLEL_MIN_PAGES, or
+        unless enable_page_pool() was called in this process; pages are
+        then extracted lazily on first use. If the worker pool fails, the
+        pages are likewise left to lazy extraction.
+
+        Args:
+            layout (bool): Also prefetch words and vector drawings, which the
+                layout engine needs.
+        """
+        if not _page_pool_enabled or self.page_count < PARALLEL_MIN_PAGES or PAGE_WORKERS < 2:
+            return
+
+        pending = [i for i in range(self.page_count) if i not in self._blocks]
+        if not pending:
+            return
+        if self.data is not None:
+            source = self.data
+        elif self.doc.name and os.path.isfile(self.doc.name):
+            source = self.doc.name
+        else:
+            source = self.doc.tobytes()
+
+        # A pool per document, stopped before returning: one kept alive in
+        # an executor worker would outlive it, as nothing stops it when the
+        # worker exits. Its start-up costs a few ms against the tens of ms a
+        # long document saves.
+        workers = min(PAGE_WORKERS, len(pending))
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(_extract_pages, source, pending[i::workers], layout)
+                    for i in range(workers)
+                ]
+                for future in futures:
+                    for page_no, (blocks, words, drawings) in future.result().items():
+                        self._blocks[page_no] = blocks
+                        if layout:
+                            self._words[page_no] = words
+                            self._drawings[page_no] = drawings
+        except Exception:
+            # Extraction stays lazy for the pages not received
+            pass
+
+    # ------------------------------------------------------------------
+    # Cached artifacts
+    # ------------------------------------------------------------------
+
+    @property
+    def page_count(self) -> int:
+        """Number of pages, read from the document metadata."""
+        if self._page_count is None:
+            self._page_count = self.doc.page_count
+        return self._page_count
+
+    def page(self, page_no: int) -> "fitz.Page":
+        """Page object, kept alive for the TextPage that refers back to it."""
+        if page_no not in self._pages:
+            self._pages[page_no] = self.doc[page_no]
+        return self._pages[page_no]
+
+    def textpage(self, page_no: int) -> "fitz.TextPage":
+        """Parsed text layer of one page, shared by every text accessor."""
+        if page_no not in self._textpages:
+            self._textpages[page_no] = self.page(page_no).get_textpage()
+        return self._textpages[page_no]
+
+    def blocks(self, page_no: int) -> list:
+        """Text blocks ``(x0, y0, x1, y1, text, block_no, type)`` of one page."""
+        if page_no not in self._blocks:
+            self._blocks[page_no] = self.page(page_no).get_text("blocks", textpage=self.textpage(page_no))
+        return self._blocks[page_no]
+
+    def page_text(self, page_no: int) -> str:
+        """Plain text of one page (the concatenation of its blocks)."""
+        if page_no not in self._page_text:
+            self._page_text[page_no] = "".join(b[4] for b in self.blocks(page_no))
+        return self._page_text[page_no]
+
+    def clip_text(self, page_no: int, rect: "fitz.Rect | tuple") -> str:
+        """
+        Text of the blocks whose centre lies inside *rect*, in page order.
+
+        Equivalent to ``page.get_text(clip=rect)`` at block granularity, but
+        served from the cached blocks instead of re-walking the text layer.
+        """
+        x0, y0, x1, y1 = rect
+        return "".join(
+            b[4] for b in self.blocks(page_no)
+            if x0 <= (b[0] + b[2]) / 2 <= x1 and y0 <= (b[1] + b[3]) / 2 <= y1
+        )
+
+    @property
+    def text(self) -> str:
+        """Plain text of all pages, joined with newlines."""
+        if self._text is None:
+            self._text = "\n".join(self.page_text(i) for i in range(self.page_count))
+        return self._text
+
+    def words(self, page_no: int) -> list:
+        """Word tuples ``(x0, y0, x1, y1, word, block, line, word_no)`` of one page."""
+        if page_no not in self._words:
+            self._words[page_no] = self.page(page_no).get_text("words", textpage=self.textpage(page_no))
+        return self._words[page_no]
+
+    def images(self, page_no: int) -> list:
+        """Image list (``page.get_images(full=True)``) of one page."""
+        if page_no not in self._images:
+            self._images[page_no] = self.doc[page_no].get_images(full=True)
+        return self._images[page_no]
+
+    def drawings(self, page_no: int) -> list:
+        """Vector drawings (``page.get_drawings()``) of one page."""
+        if page_no not in self._drawings:
+            self._drawings[page_no] = self.doc[page_no].get_drawings()
+        return self._drawings[page_no]
+
+    @property
+    def image_count(self) -> int:
+        """Total number of embedded images across all pages."""
+        return sum(len(self.images(i)) for i in range(self.page_count))
+
+    def pixmap(self, page_no: int, dpi: int = 200, grayscale: bool = False) -> "fitz.Pixmap":
+        """
+        Rendered pixmap of one page, cached per (page, dpi, colorspace).
+
+        The cached pixmap keeps any NumPy view from ``pixmap_to_array`` valid
+        for the lifetime of this document.
+        """
+        key = (page_no, dpi, grayscale)
+        if key not in self._pixmaps:
+            self._pixmaps[key] = render_page(self.doc[page_no], dpi=dpi, grayscale=grayscale)
+        return self._pixmaps[key]
+
+    def is_page_blank(self, page_no: int, dpi: int = BLANK_CHECK_DPI) -> bool:
+        """Blank-page check that reuses the cached text and image list."""
+        return is_page_blank(
+            self.doc[page_no],
+            dpi=dpi,
+            text=self.page_text(page_no),
+            images=self.images(page_no),
+        )
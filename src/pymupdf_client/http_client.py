@@ -0,0 +1,128 @@
+"""
+HTTP Client Module
+
+A shared, connection-pooled ``requests.Session`` for the GSPPI API and PDF
+downloads. Connections are kept alive and reused across calls, transient
+failures are retried with exponential backoff, and connect and read
+timeouts are set separately.
+
+The session is thread-safe for this use. The synchronous helpers call it
+directly, and the async pipeline calls them through ``asyncio.to_thread``,
+so both draw on the same pool.
+
+Configuration (environment):
+    HTTP_POOL_SIZE        Connections kept per host (default 16; keep it at
+                          least BATCH_MAX_IN_FLIGHT).
+    HTTP_CONNECT_TIMEOUT  Seconds to establish a connection (default 5).
+    HTTP_READ_TIMEOUT     Seconds to wait between bytes received (default 60).
+    HTTP_RETRIES          Retries on connection errors and 429/5xx (default 3).
+    HTTP_BACKOFF_FACTOR   Backoff base in seconds: 0.5 → 0.5s, 1s, 2s, …
+"""
+
+import os
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+
+# Pass as ``timeout=`` on every request
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session() -> "requests.Session":
+    # Imported here so importing this module stays cheap (see helper.warm_up)
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        # The GSPPI POST only reads the invoice list, so it is safe to repeat
+        allowed_methods=frozenset({"GET", "HEAD", "POST"}),
+        respect_retry_after_header=True,
+        # Hand the last response back so raise_for_status reports it
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> "requests.Session":
+    """Return the shared session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+
+def close_session():
+    """Close the shared session and its pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _discard_session():
+    # A forked child must not share the parent's sockets
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_discard_session)
+
+
+def pool_stats() -> dict:
+    """
+    Report connection reuse across the pools that are currently open.
+
+    Returns:
+        dict: hosts (open pools), requests sent (including retries),
+        connections_opened, and connections_reused (requests that went
+        over an already-open connection).
+    """
+    with _session_lock:
+        session = _session
+    hosts = sent = opened = 0
+    if session is not None:
+        for adapter in {id(a): a for a in session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                hosts += 1
+                sent += pool.num_requests
+                opened += pool.num_connections
+    return {
+        "hosts": hosts,
+        "requests": sent,
+        "connections_opened": opened,
+        "connections_reused": max(sent - opened, 0),
+    }
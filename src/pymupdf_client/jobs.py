@@ -0,0 +1,354 @@
+"""
+Jobs Module
+
+Background jobs for work that outlives an HTTP request: a client submits
+an upload or a GSPPI batch, gets a job id straight away, and polls for the
+status and result instead of holding a connection open for the whole run.
+
+Jobs are kept in a SQLite table (JOBS_DB), so queued work survives a
+restart: a job left 'running' by a crashed process is queued again on the
+next start. A JobRunner runs JOB_WORKERS jobs at a time on the event loop;
+the CPU-bound stages they call still go to the shared executor (see
+workers). Several uvicorn workers can share one JOBS_DB, since each job is
+claimed atomically by exactly one of them.
+
+Job lifecycle: queued → running → succeeded | failed.
+
+Configuration (environment):
+    JOBS_DB              Database path (default jobs.db).
+    JOB_WORKERS          Jobs run concurrently per process (default 2).
+    JOB_POLL_INTERVAL    Seconds between checks for jobs submitted by other
+                         processes (default 1).
+    JOB_RETENTION_DAYS   Finished jobs older than this are deleted on
+                         start-up (default 7).
+    JOB_RECOVER_ON_START Requeue jobs left 'running' on start-up (default
+                         true). With several uvicorn workers on one JOBS_DB,
+                         a worker starting late would requeue jobs its
+                         siblings are running, so set it to false there and
+                         recover with JobStore.requeue_running() from a
+                         one-off script after a crash.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+JOB_RECOVER_ON_START = os.getenv("JOB_RECOVER_ON_START", "true").lower() in ("1", "true", "yes")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              TEXT PRIMARY KEY,
+    kind            TEXT NOT NULL,
+    status          TEXT NOT NULL,
+    params          TEXT NOT NULL,
+    payload         BLOB,
+    progress_done   INTEGER NOT NULL DEFAULT 0,
+    progress_total  INTEGER,
+    result          TEXT,
+    error           TEXT,
+    error_status    INTEGER,
+    created_at      TEXT NOT NULL,
+    started_at      TEXT,
+    finished_at     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+# Columns reported by JobStore.get (everything but the payload and result)
+STATUS_COLUMNS = (
+    "id, kind, status, params, progress_done, progress_total, "
+    "error, error_status, created_at, started_at, finished_at"
+)
+
+
+class JobError(Exception):
+    """
+    Raised by a job handler to fail its job with a specific HTTP status.
+
+    Attributes:
+        status_code (int): Returned by the result endpoint for this job.
+        detail (str): The error message.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobStore:
+    """
+    SQLite-backed job table.
+
+    Each thread gets its own connection; WAL mode lets status polls run
+    alongside job updates.
+    """
+
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        self._local = threading.local()
+        self._pid = None
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            with self._init_lock:
+                if self._pid != os.getpid():
+                    self._local = threading.local()
+                    conn = self._open()
+                    try:
+                        conn.executescript(SCHEMA)
+                    finally:
+                        conn.close()
+                    self._pid = os.getpid()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def submit(self, kind: str, params: Optional[dict] = None, payload: Optional[bytes] = None) -> str:
+        """Queue a job and return its id."""
+        job_id = uuid.uuid4().hex
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, status, params, payload, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, json.dumps(params or {}), payload, _now()),
+        )
+        return job_id
+
+    def claim(self) -> Optional[sqlite3.Row]:
+        """
+        Atomically move the oldest queued job to 'running' and return it
+        (with its payload), or None if the queue is empty.
+        """
+        return self._connect().execute(
+            "UPDATE jobs SET status = 'running', started_at = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1) "
+            "AND status = 'queued' "
+            "RETURNING id, kind, params, payload",
+            (_now(),),
+        ).fetchone()
+
+    def set_progress(self, job_id: str, done: int, total: Optional[int] = None):
+        self._connect().execute(
+            "UPDATE jobs SET progress_done = ?, progress_total = COALESCE(?, progress_total) WHERE id = ?",
+            (done, total, job_id),
+        )
+
+    def finish(self, job_id: str, result: Any):
+        """Mark a job succeeded and store its result; its payload is dropped."""
+        self._connect().execute(
+            "UPDATE jobs SET status = 'succeeded', result = ?, payload = NULL, finished_at = ? WHERE id = ?",
+            (json.dumps(result, ensure_ascii=False), _now(), job_id),
+        )
+
+    def fail(self, job_id: str, error: str, error_status: int = 500):
+        """Mark a job failed; its payload is dropped."""
+        self._connect().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, error_status = ?, payload = NULL, finished_at = ? "
+            "WHERE id = ?",
+            (error, error_status, _now(), job_id),
+        )
+
+    def requeue_running(self) -> int:
+        """
+        Queue again every job left 'running', e.g. by a crashed process.
+
+        Only call this when no other process is running jobs from the same
+        database, i.e. at start-up of a single-process deployment, or of
+        the first worker.
+
+        Returns:
+            int: The number of jobs requeued.
+        """
+        return self._connect().execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, progress_done = 0 WHERE status = 'running'"
+        ).rowcount
+
+    def purge(self, older_than_days: float = JOB_RETENTION_DAYS) -> int:
+        """Delete finished jobs older than *older_than_days*; return the count."""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+        return self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?", (cutoff,)
+        ).rowcount
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        Return a job's status, or None if it does not exist.
+
+        Returns:
+            dict: id, kind, status, params, progress {done, total}, error,
+            error_status and timestamps.
+        """
+        row = self._connect().execute(f"SELECT {STATUS_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["progress"] = {"done": job.pop("progress_done"), "total": job.pop("progress_total")}
+        return job
+
+    def get_result(self, job_id: str) -> Any:
+        """Return a succeeded job's result (None for any other job)."""
+        row = self._connect().execute(
+            "SELECT result FROM jobs WHERE id = ? AND status = 'succeeded'", (job_id,)
+        ).fetchone()
+        return json.loads(row["result"]) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        """Return the number of jobs per status."""
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+
+# A handler receives the job's params, its payload and a progress callback
+# ``progress(done, total=None)`` (to call from the event loop; the write is
+# scheduled, not waited for), and returns the JSON-serialisable result.
+JobHandler = Callable[[dict, Optional[bytes], Callable[..., None]], Awaitable[Any]]
+
+
+class JobRunner:
+    """
+    Runs queued jobs on the event loop, JOB_WORKERS at a time.
+
+    Args:
+        store (JobStore): The job table.
+        handlers (dict): Job kind → JobHandler.
+        workers (int): Jobs run concurrently.
+    """
+
+    def __init__(self, store: JobStore, handlers: Dict[str, JobHandler], workers: int = JOB_WORKERS):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self._wakeup = None
+        self._tasks = []
+
+    async def start(self, recover: bool = True):
+        """
+        Start the worker tasks. With *recover*, jobs left running by a
+        previous process are queued again first.
+        """
+        if recover:
+            requeued = await asyncio.to_thread(self.store.requeue_running)
+            if requeued:
+                print(f"Requeued {requeued} interrupted job(s)")
+        await asyncio.to_thread(self.store.purge)
+
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the worker tasks; interrupted jobs are requeued on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers after a submit (call from the event loop)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _work(self):
+        while True:
+            job = None
+            try:
+                job = await asyncio.to_thread(self.store.claim)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # E.g. the database stayed locked past the busy timeout, or
+                # the result could not be stored. Keep the worker alive:
+                # an error here must not stop this process running jobs
+                where = f" on job {job['id']}" if job is not None else ""
+                print(f"Warning: Job worker error{where}: {e!r}")
+                if job is not None:
+                    try:
+                        await asyncio.to_thread(self.store.fail, job["id"], f"Internal error: {e}")
+                    except Exception as fail_error:
+                        # Left 'running'; requeued on the next start
+                        print(f"Warning: Could not mark job {job['id']} failed: {fail_error!r}")
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    async def _run(self, job: sqlite3.Row):
+        # Every write goes to a thread: a sibling process holding the
+        # database must not stall the event loop for the busy timeout
+        job_id = job["id"]
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await asyncio.to_thread(self.store.fail, job_id, f"Unknown job kind '{job['kind']}'")
+            return
+
+        # Progress not yet written, and the task writing it. One task per
+        # job writes in order, and skips figures already superseded
+        pending = {}
+        writer = None
+
+        async def write_progress():
+            while pending:
+                done, total = pending.pop("progress")
+                await asyncio.to_thread(self.store.set_progress, job_id, done, total)
+
+        def progress(done: int, total: Optional[int] = None):
+            nonlocal writer
+            if total is None and "progress" in pending:
+                total = pending["progress"][1]
+            pending["progress"] = (done, total)
+            if writer is None or writer.done():
+                writer = asyncio.create_task(write_progress())
+
+        try:
+            result = await handler(json.loads(job["params"]), job["payload"], progress)
+        except asyncio.CancelledError:
+            raise  # Shutting down; left 'running' and requeued on restart
+        except JobError as e:
+            outcome = partial(self.store.fail, job_id, e.detail, e.status_code)
+        except Exception as e:
+            outcome = partial(self.store.fail, job_id, str(e))
+        else:
+            outcome = partial(self.store.finish, job_id, result)
+
+        # After any progress still being written, which must not land last
+        if writer is not None:
+            await asyncio.gather(writer, return_exceptions=True)
+        await asyncio.to_thread(outcome)
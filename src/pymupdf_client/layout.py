@@ -0,0 +1,410 @@
+"""
+Layout Extraction Module
+
+This module provides the page-geometry side of PyMuPDFClient:
+
+- Region: section templates, i.e. page rectangles bounded by anchor text
+  blocks or page fractions, so each section is read from its own clip.
+- WordIndex / LayoutTableParser: a geometry-based alternative to the
+  text/regex table parser. Words are taken with their bounding boxes from
+  ``page.get_text("words")`` and stored in a grid-bucket spatial index, so
+  the line-item table can be read cell by cell: columns come from the
+  table's vertical rules (or, failing that, from the header words), rows
+  from the serial-number column, and every cell is a single rectangle query.
+"""
+
+import re
+from bisect import bisect_right
+from typing import Iterator
+
+import fitz  # PyMuPDF
+
+
+# Header keyword (lower-case prefix of the column heading) -> row field
+TABLE_COLUMNS = (
+    ("sl", "sl_no"),
+    ("resource", "resource_name"),
+    ("hsn", "hsn_sac"),
+    ("po", "po_no"),
+    ("bill", "bill_rate"),
+    ("ericsson", "ericsson_invoice_code"),
+    ("taxable", "taxable_value"),
+    ("cgst", "cgst"),
+    ("sgst", "sgst"),
+    ("igst", "igst"),
+    ("total", "total_inr"),
+)
+
+SL_NO_RE = re.compile(r"\d{1,3}")
+
+
+class Region:
+    """
+    A section template: a page rectangle whose edges are anchors or fractions.
+
+    Each edge is either a float (a fraction of the page width/height) or a
+    string naming the anchor text block the edge is taken from:
+
+    - top: the anchor block's top edge (the anchor is the first line).
+    - bottom: the anchor block's bottom edge, so the terminating block is
+      included and label patterns that look ahead to it still match.
+    - left / right: the anchor block's left edge.
+
+    Anchors are the phrases a text block starts with; the top-most such block
+    on the page is used (see ``find_anchors``). A missing anchor makes the
+    whole region unresolvable, unless the region is *optional*, in which case
+    that edge falls back to the page edge.
+
+    Example:
+        >>> Region(top="NOTE:", bottom="Bank details")
+    """
+
+    def __init__(self, top: "str | float" = 0.0, bottom: "str | float" = 1.0,
+                 left: "str | float" = 0.0, right: "str | float" = 1.0,
+                 optional: bool = False):
+        self.top = top
+        self.bottom = bottom
+        self.left = left
+        self.right = right
+        self.optional = optional
+
+    @property
+    def anchors(self) -> set:
+        """The anchor phrases this template depends on."""
+        return {v for v in (self.top, self.bottom, self.left, self.right) if isinstance(v, str)}
+
+    def resolve(self, anchors: dict, page_rect: "fitz.Rect") -> tuple | None:
+        """
+        Resolve the template against one page.
+
+        Args:
+            anchors (dict): Phrase -> anchor block, from ``find_anchors``.
+            page_rect (fitz.Rect): The page rectangle.
+
+        Returns:
+            tuple | None: The region ``(x0, y0, x1, y1)``, or None if any
+            anchor is missing from the page and the region is not optional.
+        """
+        edges = []
+        for value, side, size, origin, page_edge in (
+            (self.left, 0, page_rect.width, page_rect.x0, page_rect.x0),
+            (self.top, 1, page_rect.height, page_rect.y0, page_rect.y0),
+            (self.right, 0, page_rect.width, page_rect.x0, page_rect.x1),
+            (self.bottom, 3, page_rect.height, page_rect.y0, page_rect.y1),
+        ):
+            if isinstance(value, str):
+                block = anchors.get(value)
+                if block is not None:
+                    edges.append(block[side])
+                elif self.optional:
+                    edges.append(page_edge)
+                else:
+                    return None
+            else:
+                edges.append(origin + value * size)
+        return tuple(edges)
+
+
+def find_anchors(blocks: list, phrases: set) -> dict:
+    """
+    Map each phrase to the top-most text block that starts with it.
+
+    Args:
+        blocks (list): Output of ``page.get_text("blocks")``.
+        phrases (set): Anchor phrases to look for.
+
+    Returns:
+        dict: Phrase -> block tuple, for the phrases found on the page.
+    """
+    anchors = {}
+    for block in blocks:
+        for phrase in phrases:
+            if block[4].startswith(phrase):
+                best = anchors.get(phrase)
+                if best is None or (block[1], block[0]) < (best[1], best[0]):
+                    anchors[phrase] = block
+    return anchors
+
+
+class WordIndex:
+    """
+    Grid-bucket spatial index over the words of one page.
+
+    Each word is filed under the grid cell that contains its centre, so a
+    rectangle query only visits the buckets the rectangle overlaps.
+
+    Attributes:
+        words (list): Word tuples ``(x0, y0, x1, y1, text, block, line, word_no)``.
+    """
+
+    def __init__(self, words: list, cell_size: float = 24.0):
+        """
+        Build the index.
+
+        Args:
+            words (list): Output of ``page.get_text("words")``.
+            cell_size (float): Grid cell edge length in points (default: 24).
+        """
+        self.words = words
+        self._cell = cell_size
+        self._buckets = {}
+        for w in words:
+            cx, cy = (w[0] + w[2]) / 2, (w[1] + w[3]) / 2
+            key = (int(cx // cell_size), int(cy // cell_size))
+            self._buckets.setdefault(key, []).append((cx, cy, w))
+
+    def query(self, x0: float, y0: float, x1: float, y1: float) -> list:
+        """
+        Return the words whose centre lies inside a rectangle, in reading order.
+
+        Args:
+            x0, y0, x1, y1 (float): The query rectangle (x1/y1 exclusive).
+
+        Returns:
+            list: ``(cx, cy, word)`` entries sorted by line (top to bottom),
+            then left to right.
+        """
+        cell = self._cell
+        buckets = self._buckets
+        hits = []
+        for gy in range(int(y0 // cell), int(y1 // cell) + 1):
+            for gx in range(int(x0 // cell), int(x1 // cell) + 1):
+                for entry in buckets.get((gx, gy), ()):
+                    cx, cy = entry[0], entry[1]
+                    if x0 <= cx < x1 and y0 <= cy < y1:
+                        hits.append(entry)
+        hits.sort(key=lambda e: (round(e[2][3]), e[2][0]))
+        return hits
+
+    def text(self, x0: float, y0: float, x1: float, y1: float) -> str:
+        """Return the words inside a rectangle joined by single spaces."""
+        return " ".join(e[2][4] for e in self.query(x0, y0, x1, y1))
+
+    def find(self, word: str, start_y: float = 0.0) -> tuple | None:
+        """Return the top-most word equal to *word* at or below *start_y*."""
+        found = [w for w in self.words if w[4] == word and w[1] >= start_y]
+        return min(found, key=lambda w: (w[1], w[0])) if found else None
+
+    def find_phrase(self, phrase: str, start_y: float = 0.0) -> tuple | None:
+        """
+        Return the bounding box ``(x0, y0, x1, y1)`` of the top-most
+        occurrence of a multi-word *phrase* on a single line.
+        """
+        parts = phrase.split()
+        best = None
+        for w in self.words:
+            if w[4] != parts[0] or w[1] < start_y:
+                continue
+            line = [v for v in self.words if v[5:7] == w[5:7] and v[7] >= w[7]]
+            line.sort(key=lambda v: v[7])
+            if [v[4] for v in line[:len(parts)]] == parts:
+                last = line[len(parts) - 1]
+                box = (w[0], w[1], last[2], last[3])
+                if best is None or box[1] < best[1]:
+                    best = box
+        return best
+
+
+class LayoutTableParser:
+    """
+    Resolve the line-item table of one page purely from geometry.
+
+    A table may run over several pages. A continuation page that does not
+    repeat the header row is parsed with the columns of the previous page,
+    passed in as *columns*. A row can be split by the page break, so the
+    last row of a page the table runs on from is not yielded but kept as
+    ``open_row``; the next page's parser completes it with the words above
+    its first serial number, as the text engine does when it joins pages.
+
+    Attributes:
+        columns (tuple | None): ``(edges, fields)`` of the table on this page,
+            available after ``iter_rows`` has run.
+        ends_table (bool): True once ``iter_rows`` found the "Total Invoice
+            Value" row on this page.
+        open_row (dict | None): After ``iter_rows``, the row still open at
+            the bottom of the page. Pass it to the next page's parser, or
+            yield it if there is no next page.
+    """
+
+    def __init__(self, words: list, drawings: list, page_rect: "fitz.Rect",
+                 columns: tuple | None = None, open_row: dict | None = None):
+        """
+        Args:
+            words (list): Output of ``page.get_text("words")``.
+            drawings (list): Output of ``page.get_drawings()``.
+            page_rect (fitz.Rect): The page rectangle.
+            columns (tuple | None): ``(edges, fields)`` carried over from the
+                previous page of the same table.
+            open_row (dict | None): The previous page's ``open_row``.
+        """
+        self.index = WordIndex(words)
+        self.drawings = drawings
+        self.page_rect = page_rect
+        self.columns = columns
+        self.open_row = open_row
+        self.ends_table = False
+
+    # ------------------------------------------------------------------
+    # Geometry helpers
+    # ------------------------------------------------------------------
+
+    def _vertical_rules(self, y: float) -> list:
+        """Return ``(x, y0, y1)`` for every vertical rule crossing height *y*."""
+        rules = []
+        for d in self.drawings:
+            for item in d["items"]:
+                if item[0] == "re":
+                    r = item[1]
+                    if r.width <= 1.5 and r.height > 5 and r.y0 <= y <= r.y1:
+                        rules.append(((r.x0 + r.x1) / 2, r.y0, r.y1))
+                elif item[0] == "l":
+                    a, b = item[1], item[2]
+                    if abs(a.x - b.x) <= 0.5 and min(a.y, b.y) <= y <= max(a.y, b.y):
+                        rules.append((a.x, min(a.y, b.y), max(a.y, b.y)))
+        return rules
+
+    def _column_edges(self, anchor: tuple) -> tuple:
+        """
+        Return ``(edges, header_bottom)`` for the header row at *anchor*.
+
+        Edges come from the vertical rules of the header row. Without rules,
+        each edge falls just right of a header word group, since cell text
+        is left-aligned or centred under its heading and never starts left
+        of the previous heading's end.
+        """
+        y_mid = (anchor[1] + anchor[3]) / 2
+        rules = self._vertical_rules(y_mid)
+        edges = []
+        for x, _, _ in sorted(rules):
+            if not edges or x - edges[-1] > 2.0:
+                edges.append(x)
+        if len(edges) >= len(TABLE_COLUMNS) + 1:
+            header_bottom = min(y1 for _, _, y1 in rules)
+            return edges, header_bottom
+
+        # Fallback: no ruling, derive edges from the header words themselves
+        header = [e[2] for e in self.index.query(
+            self.page_rect.x0, anchor[1] - 1, self.page_rect.x1, anchor[3] + 14)]
+        header.sort(key=lambda w: w[0])
+        groups = []
+        for w in header:
+            if groups and w[0] - groups[-1][1] < 4.0:
+                groups[-1][1] = max(groups[-1][1], w[2])
+            else:
+                groups.append([w[0], w[2]])
+        edges = [self.page_rect.x0]
+        edges += [min(a[1] + 1.0, b[0]) for a, b in zip(groups, groups[1:])]
+        edges.append(self.page_rect.x1)
+        return edges, max(w[3] for w in header) + 1
+
+    def _column_fields(self, edges: list, top: float, bottom: float) -> list:
+        """Name each column after the header words that sit inside it."""
+        fields = []
+        for x0, x1 in zip(edges, edges[1:]):
+            heading = self.index.text(x0, top, x1, bottom).lower()
+            fields.append(next((f for key, f in TABLE_COLUMNS if heading.startswith(key)), None))
+        return fields
+
+    def _text_bottom(self, x0: float, top: float, x1: float, bottom: float, max_gap: float) -> float:
+        """
+        Return where the run of text lines starting at *top* ends.
+
+        The run ends at the first vertical gap wider than *max_gap*, so text
+        further down the page (signatures, footers) is not taken as part of
+        the last table row.
+        """
+        run_bottom = top
+        for _, _, w in self.index.query(x0, top, x1, bottom):
+            if w[1] - run_bottom > max_gap:
+                break
+            run_bottom = max(run_bottom, w[3])
+        return run_bottom + 1
+
+    def _read_row(self, edges: list, fields: list, top: float, bottom: float) -> dict:
+        """Return the row formed by the words between *top* and *bottom*."""
+        # One band query; each word drops into its column by bisection
+        cells = [[] for _ in fields]
+        for cx, _, w in self.index.query(edges[0], top, edges[-1], bottom):
+            cells[bisect_right(edges, cx) - 1].append(w[4])
+        row = {f: "" for _, f in TABLE_COLUMNS}
+        for cell, field in zip(cells, fields):
+            if field is not None:
+                row[field] = " ".join(cell)
+        return row
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def parse(self) -> list:
+        """
+        Parse all line-item rows on the page.
+
+        Returns:
+            list[dict]: One dict per row with the same keys as the text
+            engine produces. Empty when no table header is found.
+        """
+        return list(self.iter_rows())
+
+    def iter_rows(self) -> Iterator[dict]:
+        """
+        Yield the line-item rows on the page one at a time.
+
+        Yields:
+            dict: One row per line item, in table order.
+        """
+        anchor = self.index.find("Sl.")
+        if anchor is not None:
+            edges, header_bottom = self._column_edges(anchor)
+            fields = self._column_fields(edges, anchor[1] - 1, header_bottom)
+            if "sl_no" not in fields:
+                return
+            self.columns = (edges, fields)
+        elif self.columns is not None:
+            # Continuation page without a repeated header row
+            edges, fields = self.columns
+            header_bottom = self.page_rect.y0
+        else:
+            return
+        columns = list(zip(edges, edges[1:]))
+
+        # The table ends at the "Total Invoice Value" row
+        end = self.index.find_phrase("Total Invoice Value", start_y=header_bottom)
+        self.ends_table = end is not None
+        table_bottom = end[1] if end else self.page_rect.y1
+
+        # Rows start wherever the serial-number column holds a 1-3 digit number
+        sl_x0, sl_x1 = columns[fields.index("sl_no")]
+        sl_words = [
+            e[2] for e in self.index.query(sl_x0, header_bottom, sl_x1, table_bottom)
+            if SL_NO_RE.fullmatch(e[2][4])
+        ]
+
+        if self.open_row is not None:
+            # The words above the first serial number finish the row the
+            # previous page left open
+            row, self.open_row = self.open_row, None
+            rest_bottom = sl_words[0][1] - 1 if sl_words else table_bottom
+            for field, text in self._read_row(edges, fields, header_bottom, rest_bottom).items():
+                if text:
+                    row[field] = f"{row[field]} {text}".lstrip()
+            if sl_words or self.ends_table:
+                yield row
+            else:
+                self.open_row = row  # The whole page continues it
+
+        left, right = edges[0], edges[-1]
+        for i, sl in enumerate(sl_words):
+            row_top = sl[1] - 1
+            if i + 1 < len(sl_words):
+                row_bottom = sl_words[i + 1][1] - 1
+            elif self.ends_table:
+                row_bottom = table_bottom
+            else:
+                # The table runs on: stop the last row where its text ends
+                row_bottom = self._text_bottom(left, row_top, right, table_bottom, 2 * (sl[3] - sl[1]))
+            row = self._read_row(edges, fields, row_top, row_bottom)
+            if i + 1 == len(sl_words) and not self.ends_table:
+                self.open_row = row  # May carry on at the top of the next page
+            else:
+                yield row
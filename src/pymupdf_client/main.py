@@ -20,9 +20,14 @@ import os
 from pathlib import Path
 from typing import Any, Dict
 
+from document import InvoiceDocument, enable_page_pool
 from pdf_client import PyMuPDFClient
 from validator import InvoiceValidator
-from helper import pdf_to_png_images, are_pdf_pages_blank
+from helper import check_pdf_structure
+
+
+# Longest invoice accepted; line items may continue onto further pages
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "10"))
 
 
 # ---------------------------------------------------------------------------
@@ -41,19 +46,9 @@ class InvoiceProcessor:
     # PDF validation
     # ------------------------------------------------------------------
 
-    def _validate_pdf(self, pdf_path: str) -> None:
-        """Ensure the PDF is a single, non-blank page."""
-        pages = pdf_to_png_images(pdf_path, dpi=150)
-
-        if len(pages) > 1:
-            raise ValueError(
-                f"Invalid PDF: contains {len(pages)} pages. "
-                "Only single-page invoices are accepted."
-            )
-
-        blank_flags = are_pdf_pages_blank(pdf_path, dpi=150)
-        if blank_flags[0]:
-            raise ValueError("Invalid PDF: the first page is blank.")
+    def _validate_pdf(self, document: InvoiceDocument) -> None:
+        """Ensure the PDF has at most MAX_PDF_PAGES pages and a non-blank first page."""
+        check_pdf_structure(document, max_pages=MAX_PDF_PAGES)
 
     # ------------------------------------------------------------------
     # Core steps
@@ -64,14 +59,16 @@ class InvoiceProcessor:
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"Invoice PDF not found: {pdf_path}")
 
-        print("[1/3] Validating PDF …")
-        self._validate_pdf(pdf_path)
-        print("      PDF validation passed.")
+        # One document is shared by validation and extraction
+        with InvoiceDocument(pdf_path) as document:
+            print("[1/3] Validating PDF …")
+            self._validate_pdf(document)
+            print("      PDF validation passed.")
 
-        print("[2/3] Extracting data with PyMuPDF …")
-        client = PyMuPDFClient(pdf_path)
-        data = client.extract_invoice_data()
-        print("      Extraction complete.")
+            print("[2/3] Extracting data with PyMuPDF …")
+            client = PyMuPDFClient(document)
+            data = client.extract_invoice_data()
+            print("      Extraction complete.")
 
         return data
 
@@ -222,6 +219,9 @@ def main() -> None:
     pdf_path   = sys.argv[1]
     output_dir = sys.argv[2] if len(sys.argv) > 2 else "output"
 
+    # Single-threaded here, so long invoices can be extracted page-parallel
+    enable_page_pool()
+
     try:
         processor = InvoiceProcessor()
         results   = processor.process(pdf_path, output_dir)
@@ -8,8 +8,386 @@ producing output in the same schema as the GeminiClient.
 
 import re
 import json
+from typing import Iterator, Optional
+
 import fitz  # PyMuPDF
 
+from document import InvoiceDocument
+from layout import LayoutTableParser, Region, find_anchors
+from metrics import StageTimings
+
+
+ENGINES = ("text", "layout")
+
+# Bump whenever a change alters the extracted output; cached results are
+# keyed by it (see result_cache)
+EXTRACTOR_VERSION = "1"
+
+
+# ------------------------------------------------------------------
+# Compiled extraction plan
+# ------------------------------------------------------------------
+
+# Characters lower-cased at a time when indexing labels
+LABEL_SCAN_WINDOW = 1 << 16
+
+class FieldScanner:
+    """
+    Locate many label-anchored regex fields in a single pass over a text.
+
+    Every field is declared as ``(label, pattern)`` or ``(label, pattern,
+    flags)``, where *pattern* has one capturing group and begins with the
+    literal *label* (matched case-insensitively). All patterns are compiled
+    once, at import time. ``scan`` walks the text once to index where each
+    label occurs, then tries each field's pattern only at those offsets,
+    which gives the same first match as ``re.search`` over the whole text.
+    """
+
+    def __init__(self, fields: dict):
+        """
+        Compile the scan plan.
+
+        Args:
+            fields (dict): Field name -> ``(label, pattern[, flags])``.
+                *flags* defaults to ``re.IGNORECASE | re.DOTALL``.
+        """
+        labels = sorted({spec[0].lower() for spec in fields.values()}, key=len)
+
+        # A label that extends a shorter label shares its offsets; this keeps
+        # two alternatives from ever competing for the same position.
+        canonical = {
+            label: next(short for short in labels if label.startswith(short))
+            for label in labels
+        }
+        keys = sorted(set(canonical.values()))
+        self._label_re = re.compile("|".join(re.escape(key) for key in keys))
+        self._label_re_i = re.compile(self._label_re.pattern, re.IGNORECASE)
+        self._overlap = max(map(len, keys)) - 1
+
+        self._fields = []
+        for name, spec in fields.items():
+            label, pattern = spec[0], spec[1]
+            flags = spec[2] if len(spec) > 2 else re.IGNORECASE | re.DOTALL
+            self._fields.append((name, canonical[label.lower()], re.compile(pattern, flags)))
+
+    def _label_offsets(self, text: str) -> dict:
+        """
+        Map each label to the ascending offsets where it starts in *text*.
+
+        The text is lower-cased one window at a time, because ``str.lower``
+        allocates a working buffer of several times the string's size. Each
+        window overlaps the next by the longest label less one character, and
+        a match is kept by the window it starts in.
+        """
+        offsets = {}
+        for base in range(0, len(text), LABEL_SCAN_WINDOW):
+            window = text[base:base + LABEL_SCAN_WINDOW + self._overlap]
+            lowered = window.lower()
+            if len(lowered) != len(window):
+                # Case mapping changed the length, so offsets would not line up
+                return self._label_offsets_ignorecase(text)
+
+            match = self._label_re.search(lowered)
+            while match and match.start() < LABEL_SCAN_WINDOW:
+                offsets.setdefault(match.group(), []).append(base + match.start())
+                # Resume one character later so overlapping labels are not lost
+                match = self._label_re.search(lowered, match.start() + 1)
+        return offsets
+
+    def _label_offsets_ignorecase(self, text: str) -> dict:
+        """Slower ``_label_offsets`` that matches labels on the original text."""
+        offsets = {}
+        match = self._label_re_i.search(text)
+        while match:
+            offsets.setdefault(match.group().lower(), []).append(match.start())
+            match = self._label_re_i.search(text, match.start() + 1)
+        return offsets
+
+    def scan(self, text: str) -> dict:
+        """
+        Find every field in *text*.
+
+        Args:
+            text (str): The text to scan.
+
+        Returns:
+            dict: Field name -> ``re.Match`` (or None when not found).
+        """
+        offsets = self._label_offsets(text)
+        results = {}
+        for name, label, pattern in self._fields:
+            match = None
+            for pos in offsets.get(label, ()):
+                match = pattern.match(text, pos)
+                if match:
+                    break
+            results[name] = match
+        return results
+
+
+# Fields grouped by the page section they are read from
+SECTION_SCANNERS = {
+    "letter_head": FieldScanner({
+        "letter_head.company_name": ("Genius HRTech Limited", r"(Genius HRTech Limited)"),
+        "letter_head.former_company_name": ("(Formerly known as", r"(\(Formerly known as[^\)]+\))"),
+        "letter_head.address": ("Synthesis Business Park", r"(Synthesis Business Park\s+Tower[^\n]+\n[^\n]+?\.)\s*CIN No"),
+        "letter_head.cin": ("CIN No", r"CIN No[:\s]*([A-Z0-9]+)"),
+        "letter_head.gstin": ("GST NO", r"GST NO[:\s]*([A-Z0-9]+)"),
+        "letter_head.phone": ("Ph", r"Ph[:\s]*([\d\-/]+)"),
+        "letter_head.email": ("Email", r"Email[:\s]*([\w\.\-]+@[\w\.\-]+)"),
+        "letter_head.website": ("Web", r"Web[:\s]*(www\.[\w\.\-/]+)"),
+    }),
+    # The PAN/TAN under the TAX INVOICE heading belong to the supplier
+    "tax_invoice": FieldScanner({
+        "tax_invoice.pan_no": ("PAN NO", r"PAN NO\s*[:\s]*([A-Z]{5}\d{4}[A-Z])"),
+        "tax_invoice.tan_no": ("TAN NO", r"TAN NO\s*[:\s]*([A-Z]{4}\d{5}[A-Z])"),
+    }),
+    # Bill-to block (between "Bill To:-" and "Sl.")
+    "bill_to_details": FieldScanner({
+        "bill_to_block": ("Bill To:-", r"Bill To:-\s*(.*?)(?=Sl\.)"),
+    }),
+    "invoice_details": FieldScanner({
+        "invoice_details.date": ("Date", r"Date[:\s]*([\d]+\s+\w+\s*\d{4})"),
+        "invoice_details.invoice_no": ("Invoice", r"Invoice[:\s]*([A-Z]+/[A-Z0-9]+/\d+)"),
+        "invoice_details.service_month": ("Service Month", r"Service Month\s*[:\s]*([^\n]+)"),
+        "invoice_details.lower_tds_cert_no": ("LOWER TDS CERT", r"LOWER TDS CERT\.?\s*No\.?\s*[:\s]*([A-Z0-9]+)"),
+    }),
+    "total_invoice_value": FieldScanner({
+        # Totals line: Total Invoice Value <taxable> <cgst> <sgst> <igst> <total>
+        "total_invoice_value": (
+            "Total Invoice",
+            r"Total Invoice\s*Value\s+"
+            r"([\d,]+\.\d{2})\s+"   # taxable_value
+            r"([\d,]+\.\d{2})\s+"   # cgst
+            r"([\d,]+\.\d{2})\s+"   # sgst
+            r"([\d,]+\.\d{2})\s+"   # igst
+            r"([\d,]+\.\d{2})",      # total_inr
+            re.IGNORECASE,
+        ),
+        "total_invoice_value.in_words": (
+            "Total Invoice", r"Total Invoice\s*Value\s*\(\s*In\s*Words\s*\)[:\s]*([^\n]+)"
+        ),
+    }),
+    # Supply — no fixed place on the template, searched over the full text
+    "supply": FieldScanner({
+        "arn_for_lut": ("ARN", r"ARN[^\n]*[:\s]*([^\n]+)"),
+        "supply": ("Supply", r"(?<!Place of )(?<!Place Of )Supply\s*:\s*([^\n]+)"),
+        "igst_foregone": ("IGST", r"IGST\s*Foregone\s*[:\s]*([^\n]+)"),
+    }),
+    "note": FieldScanner({
+        "note_block": ("NOTE:", r"NOTE:\s*(.*?)(?=Bank details)"),
+    }),
+    "beneficiary_details": FieldScanner({
+        "beneficiary_details.beneficiary_name": (
+            "Beneficiary Name", r"Beneficiary Name\s*[:\s]*([^\n]+(?:Limited)[^\n]*)"
+        ),
+        "beneficiary_details.bank_name": ("Bank", r"Bank\s*Name\s*[:\s]*([^\n]+)"),
+        "beneficiary_details.address": ("Address", r"Address\s*[:\s]*([\d/A-Z\s]+ROAD)"),
+        "beneficiary_details.reverse_charge": ("Reverse", r"Reverse\s*Charge\s*[:\s]*(\w+)"),
+        "beneficiary_details.account_no": ("Account", r"Account\s*Number\s*[:\s]*(\d+)"),
+        "beneficiary_details.ifsc_code": ("IFSC", r"IFSC\s*Code\s*[:\s]*([A-Z0-9]+)"),
+        "beneficiary_details.micr_code": ("MICR", r"MICR\s*Code\s*[:\s]*(\d+)"),
+        "beneficiary_details.country": ("Country", r"Country\s*[:\s]*(\w+)"),
+        "beneficiary_details.authorised_signatory": (
+            "Authorised Signatory", r"Authorised Signatory\s*:\s*([^\n]+)"
+        ),
+    }),
+}
+
+# Where each section sits on the invoice template. Sections without a region,
+# or whose anchors are missing on every page, are searched in the full text.
+SECTION_REGIONS = {
+    "letter_head": Region(bottom="TAX INVOICE"),
+    "tax_invoice": Region(top="TAX INVOICE", bottom="Bill To:-"),
+    "bill_to_details": Region(top="Bill To:-", bottom="Sl.", right="Date"),
+    "invoice_details": Region(top="Date", bottom="Sl.", left="Date"),
+    "total_invoice_value": Region(top="Total Invoice Value", bottom="NOTE:"),
+    "note": Region(top="NOTE:", bottom="Bank details"),
+    "beneficiary_details": Region(top="Bank details"),
+}
+
+# The line-item table may run over several pages. On each page it spans from
+# its header row (or the page top, on a continuation page) to the totals row
+# (or the page bottom, when the table carries on).
+TABLE_REGION = Region(top="Sl.", bottom="Total Invoice Value", optional=True)
+TABLE_HEADER_RE = re.compile(r"Total\s+INR\s*\n", re.IGNORECASE)
+TABLE_END_RE = re.compile(r"Total\s+Invoice\s*Value", re.IGNORECASE)
+
+ANCHOR_PHRASES = TABLE_REGION.anchors.union(*(region.anchors for region in SECTION_REGIONS.values()))
+
+# Fields searched inside the bill-to block only, so that PAN/TAN lookups
+# don't bleed into the supplier's values above it
+BILL_TO_SCANNER = FieldScanner({
+    "gstin": ("GSTIN", r"GSTIN\s*[:\s]*([A-Z0-9]+)"),
+    "pan_no": ("Pan No", r"Pan No\s*[:\s]*([A-Z]{5}\d{4}[A-Z])"),
+    "tan_no": ("Tan No", r"Tan No\s*[:\s]*([A-Z]{4}\d{5}[A-Z])"),
+    "place_of_supply": ("Place of Supply", r"Place of Supply[:\s]*([A-Z\-0-9]+)"),
+    "irn_no": ("IRN No", r"IRN No[.\s]*([a-f0-9]{64})"),
+})
+
+BILL_TO_COMPANY_RE = re.compile(r"^([^\n]+)", re.IGNORECASE | re.DOTALL)
+BILL_TO_ADDRESS_RE = re.compile(r"^[^\n]+\n(.*?)(?=GSTIN)", re.IGNORECASE | re.DOTALL)
+NOTE_POINT_1_RE = re.compile(r"1\.\s*(.*?)(?=2\.)", re.DOTALL)
+NOTE_POINT_2_RE = re.compile(r"2\.\s*(.*?)(?=For any kind|$)", re.DOTALL)
+NOTE_POST_SCRIPT_RE = re.compile(r"(For any kind of GST[^\n]+)")
+WHITESPACE_RE = re.compile(r"\s+")
+LINE_BREAK_RE = re.compile(r"\s*\n\s*")
+
+# Line-item tokens, recognised by type rather than by line position
+SL_NO_LINE_RE = re.compile(r"\d{1,3}")
+RECORD_START_RE = re.compile(r"^\d{1,3}\n", re.MULTILINE)
+RESOURCE_NAME_RE = re.compile(r"[A-Z][A-Z\s]+")
+FLOAT_RE = re.compile(r"^\d[\d,]*\.\d{2}$")
+INT6_RE = re.compile(r"^\d{6}$")
+INT10_RE = re.compile(r"^\d{10}$")
+INVCODE_RE = re.compile(r"^[A-Z]{3,}[A-Z0-9]+$")
+
+
+def parse_line_item(lines: list) -> dict | None:
+    """
+    Parse one table record (its stripped, non-blank lines) into a row.
+
+    Two observed PyMuPDF layouts for the same invoice format:
+
+    Layout A (bill_rate == taxable_value, full month):
+        1
+        SHAILENDRA KUSHWAH
+        998513
+        8000112642 51980.00     ← po_no + bill_rate share a line
+        ERCSIN01233612
+        51980.00
+        0.00 / 0.00 / 9356.40 / 61336.40
+
+    Layout B (bill_rate != taxable_value, partial month):
+        1
+        PRASHANT KUMAR
+        998513
+        8000111210              ← po_no alone
+        52189.00                ← bill_rate alone
+        ERCSMI00239725 1739.63  ← inv_code + taxable_value share a line
+        0.00 / 0.00 / 313.13 / 2052.76
+
+    Strategy: scan all lines after hsn_sac using type-based recognition,
+    never relying on fixed line positions.
+
+    Args:
+        lines (list): The record's lines, starting with the serial number.
+
+    Returns:
+        dict | None: The row, or None if the record is not a line item.
+    """
+    if len(lines) < 2:
+        return None
+
+    # Line 0: sl_no — must be 1–3 digit integer
+    if not SL_NO_LINE_RE.fullmatch(lines[0]):
+        return None
+    sl_no = lines[0]
+
+    # Line 1: resource_name — all-caps words
+    resource_name = lines[1] if RESOURCE_NAME_RE.fullmatch(lines[1]) else ""
+
+    # Line 2: hsn_sac — exactly 6 digits
+    hsn_sac = lines[2] if len(lines) > 2 and INT6_RE.fullmatch(lines[2]) else ""
+
+    # --- Scan remaining lines with type-based recognition ---
+    po_no = bill_rate = inv_code = taxable = ""
+    trailing_floats = []  # cgst, sgst, igst, total (always standalone)
+
+    for line in lines[3:]:
+        parts = line.split()
+
+        # Pattern: "8000112642 51980.00" → po_no + bill_rate on one line (Layout A)
+        if (len(parts) == 2
+                and INT10_RE.fullmatch(parts[0])
+                and FLOAT_RE.fullmatch(parts[1])
+                and not po_no):
+            po_no, bill_rate = parts[0], parts[1]
+
+        # Pattern: standalone 10-digit int → po_no alone (Layout B)
+        elif INT10_RE.fullmatch(line) and not po_no:
+            po_no = line
+
+        # Pattern: standalone float immediately after po_no, before inv_code → bill_rate (Layout B)
+        elif FLOAT_RE.fullmatch(line) and po_no and not bill_rate and not inv_code:
+            bill_rate = line
+
+        # Pattern: "ERCSMI00239725 1739.63" → inv_code + taxable on one line (Layout B)
+        elif (len(parts) == 2
+                and INVCODE_RE.fullmatch(parts[0])
+                and FLOAT_RE.fullmatch(parts[1])
+                and not inv_code):
+            inv_code, taxable = parts[0], parts[1]
+
+        # Pattern: standalone invoice code (Layout A)
+        elif INVCODE_RE.fullmatch(line) and not inv_code:
+            inv_code = line
+
+        # Pattern: standalone float after inv_code → taxable then cgst/sgst/igst/total
+        elif FLOAT_RE.fullmatch(line) and inv_code:
+            if not taxable:
+                taxable = line
+            else:
+                trailing_floats.append(line)
+
+    return {
+        "sl_no": sl_no,
+        "resource_name": resource_name,
+        "hsn_sac": hsn_sac,
+        "po_no": po_no,
+        "bill_rate": bill_rate,
+        "ericsson_invoice_code": inv_code,
+        "taxable_value": taxable,
+        "cgst": trailing_floats[0] if len(trailing_floats) > 0 else "",
+        "sgst": trailing_floats[1] if len(trailing_floats) > 1 else "",
+        "igst": trailing_floats[2] if len(trailing_floats) > 2 else "",
+        "total_inr": trailing_floats[3] if len(trailing_floats) > 3 else "",
+    }
+
+
+def iter_line_items(text: str, start: int = 0, end: int | None = None) -> Iterator[dict]:
+    """
+    Yield line-item rows from the table block ``text[start:end]``.
+
+    Records start at every line that is a bare 1–3 digit serial number.
+    Record boundaries are found with ``finditer`` over the block in place,
+    and each record is parsed and yielded as soon as the next one begins.
+    Only the current record is held, so memory stays flat however many
+    rows the table has.
+
+    Args:
+        text (str): Text containing the table block.
+        start (int): Offset of the block in *text*.
+        end (int | None): End offset of the block (default: end of text).
+
+    Yields:
+        dict: One row per line item, in table order.
+    """
+    end = len(text) if end is None else end
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start == end:
+        return
+
+    record_start = start
+    for match in RECORD_START_RE.finditer(text, start, end):
+        if match.start() > record_start:
+            row = parse_line_item(_record_lines(text[record_start:match.start()]))
+            if row is not None:
+                yield row
+            record_start = match.start()
+
+    row = parse_line_item(_record_lines(text[record_start:end]))
+    if row is not None:
+        yield row
+
+
+def _record_lines(record: str) -> list:
+    """Return the stripped, non-blank lines of a table record."""
+    return [line.strip() for line in record.splitlines() if line.strip()]
+
 
 class PyMuPDFClient:
     """
@@ -17,45 +395,102 @@ class PyMuPDFClient:
     Produces output matching the schema defined in GeminiClient._get_response_schema().
     """
 
-    def __init__(self, pdf_path: str):
+    def __init__(self, pdf: "str | fitz.Document | InvoiceDocument", engine: str = "text"):
         """
-        Initialize the extractor with the path to the invoice PDF.
+        Initialize the extractor with the invoice PDF.
 
         Args:
-            pdf_path (str): Path to the invoice PDF file.
+            pdf (str | fitz.Document | InvoiceDocument): Path to the invoice
+                PDF file, an already-open document, or the request's shared
+                InvoiceDocument. An open document is used as-is and stays
+                owned by the caller; text and images already extracted by an
+                InvoiceDocument are reused rather than recomputed. Given a
+                path or fitz.Document, the client wraps it in an
+                InvoiceDocument of its own, released by ``close()`` (or by
+                using the client as a context manager).
+            engine (str): How the line-item table is parsed. ``"text"``
+                (default) scans the flattened page text; ``"layout"`` resolves
+                cells from word bounding boxes (see layout.py).
+
+        Raises:
+            ValueError: If the engine name is unknown.
         """
-        self.pdf_path = pdf_path
-        self.doc = fitz.open(pdf_path)
-        self.text = self._extract_text()
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown extraction engine '{engine}'. Expected one of: {', '.join(ENGINES)}.")
+        self.engine = engine
+
+        self._owns_document = not isinstance(pdf, InvoiceDocument)
+        self.document = InvoiceDocument(pdf) if self._owns_document else pdf
+        try:
+            self.doc = self.document.doc
+            self.pdf_path = self.document.name
+            self.document.prefetch_pages(layout=engine == "layout")
+            self.text = self._extract_text()
+            self._anchors = {}
+            self._fields = {}
+            for section, scanner in SECTION_SCANNERS.items():
+                self._fields.update(scanner.scan(self._section_text(section)))
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        """Close the document if the client opened it; a shared one is left open."""
+        if self._owns_document:
+            self.document.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
     # ------------------------------------------------------------------
     # Internal helpers
     # ------------------------------------------------------------------
 
     def _extract_text(self) -> str:
-        """Extract and return all text from the PDF as a single string."""
-        return "\n".join(page.get_text() for page in self.doc)
+        """Return all text from the PDF as a single string."""
+        return self.document.text
 
-    def _find(self, pattern: str, default: str = "") -> str:
+    def _section_text(self, section: str) -> str:
         """
-        Search for a regex pattern in the extracted text.
+        Return the text of the page region a section is read from.
+
+        Falls back to the full document text when the section has no region
+        or its anchors are not found on any page.
+        """
+        region = SECTION_REGIONS.get(section)
+        if region is not None:
+            for page_no in range(self.document.page_count):
+                rect = region.resolve(self._page_anchors(page_no), self.document.page(page_no).rect)
+                if rect is not None:
+                    return self.document.clip_text(page_no, rect)
+        return self.text
+
+    def _page_anchors(self, page_no: int) -> dict:
+        """Return the anchor blocks found on one page."""
+        if page_no not in self._anchors:
+            self._anchors[page_no] = find_anchors(self.document.blocks(page_no), ANCHOR_PHRASES)
+        return self._anchors[page_no]
+
+    def _field(self, name: str, default: str = "") -> str:
+        """
+        Return a field located by the section scans.
 
         Args:
-            pattern (str): Regex pattern with one capturing group.
-            default (str): Value to return when no match is found.
+            name (str): Field name in SECTION_SCANNERS.
+            default (str): Value to return when the field was not found.
 
         Returns:
-            str: Stripped match or default.
+            str: Stripped first capturing group or default.
         """
-        match = re.search(pattern, self.text, re.IGNORECASE | re.DOTALL)
+        match = self._fields[name]
         return match.group(1).strip() if match else default
 
     def _has_image(self) -> bool:
         """Return True if the PDF contains at least one embedded image."""
-        for page in self.doc:
-            if page.get_images(full=True):
-                return True
-        return False
+        return self.document.image_count > 0
 
     # ------------------------------------------------------------------
     # Section extractors
@@ -63,215 +498,134 @@ class PyMuPDFClient:
 
     def _extract_letter_head(self) -> dict:
         return {
-            "company_name": self._find(r"Authorised Signatory\n(Genius HRTech Limited)"),
-            "former_company_name": self._find(r"(\(Formerly known as[^\)]+\))"),
-            "address": re.sub(
-                r"\s*\n\s*", " ",
-                self._find(r"(Synthesis Business Park\s+Tower[^\n]+\n[^\n]+?\.)\s*CIN No")
-            ).strip(),
-            "cin": self._find(r"CIN No[:\s]*([A-Z0-9]+)"),
-            "gstin": self._find(r"GST NO[:\s]*([A-Z0-9]+)"),
-            "phone": self._find(r"Ph[:\s]*([\d\-/]+)"),
-            "email": self._find(r"Email[:\s]*([\w\.\-]+@[\w\.\-]+)"),
-            "website": self._find(r"Web[:\s]*(www\.[\w\.\-/]+)"),
+            "company_name": self._field("letter_head.company_name"),
+            "former_company_name": self._field("letter_head.former_company_name"),
+            "address": LINE_BREAK_RE.sub(" ", self._field("letter_head.address")).strip(),
+            "cin": self._field("letter_head.cin"),
+            "gstin": self._field("letter_head.gstin"),
+            "phone": self._field("letter_head.phone"),
+            "email": self._field("letter_head.email"),
+            "website": self._field("letter_head.website"),
         }
 
     def _extract_tax_invoice(self) -> dict:
         # The PAN/TAN under TAX INVOICE heading belong to the supplier
-        pan = self._find(r"PAN NO\s*[:\s]*([A-Z]{5}\d{4}[A-Z])")
-        tan = self._find(r"TAN NO\s*[:\s]*([A-Z]{4}\d{5}[A-Z])")
         return {
-            "pan_no": pan,
-            "tan_no": tan,
+            "pan_no": self._field("tax_invoice.pan_no"),
+            "tan_no": self._field("tax_invoice.tan_no"),
         }
 
     def _extract_bill_to_details(self) -> dict:
         # Isolate the bill-to block (between "Bill To:-" and "Sl.")
         # so that PAN/TAN lookups don't bleed into the supplier's values above
-        block_match = re.search(
-            r"Bill To:-\s*(.*?)(?=Sl\.)", self.text, re.IGNORECASE | re.DOTALL
-        )
+        block_match = self._fields["bill_to_block"]
         block = block_match.group(1) if block_match else ""
+        fields = BILL_TO_SCANNER.scan(block)
 
-        def find_in_block(pattern, default=""):
-            m = re.search(pattern, block, re.IGNORECASE | re.DOTALL)
+        def find_in_block(name, default=""):
+            m = fields[name]
             return m.group(1).strip() if m else default
 
         # First line of the block = company name
-        company = find_in_block(r"^([^\n]+)")
+        company_match = BILL_TO_COMPANY_RE.search(block)
+        company = company_match.group(1).strip() if company_match else ""
 
         # Address = everything from the second line up to the GSTIN line
-        address_match = re.search(
-            r"^[^\n]+\n(.*?)(?=GSTIN)", block, re.IGNORECASE | re.DOTALL
-        )
+        address_match = BILL_TO_ADDRESS_RE.search(block)
         address = ""
         if address_match:
-            address = re.sub(r"\s*\n\s*", " ", address_match.group(1)).strip()
+            address = LINE_BREAK_RE.sub(" ", address_match.group(1)).strip()
 
         return {
             "company_name": company,
             "address": address,
-            "gstin": find_in_block(r"GSTIN\s*[:\s]*([A-Z0-9]+)"),
+            "gstin": find_in_block("gstin"),
             # Pan No / Tan No scoped to the bill-to block (not the supplier block above)
-            "pan_no": find_in_block(r"Pan No\s*[:\s]*([A-Z]{5}\d{4}[A-Z])"),
-            "tan_no": find_in_block(r"Tan No\s*[:\s]*([A-Z]{4}\d{5}[A-Z])"),
-            "place_of_supply": find_in_block(r"Place of Supply[:\s]*([A-Z\-0-9]+)"),
-            "irn_no": find_in_block(r"IRN No[.\s]*([a-f0-9]{64})"),
+            "pan_no": find_in_block("pan_no"),
+            "tan_no": find_in_block("tan_no"),
+            "place_of_supply": find_in_block("place_of_supply"),
+            "irn_no": find_in_block("irn_no"),
         }
 
     def _extract_invoice_details(self) -> dict:
         return {
-            "date": self._find(r"Date[:\s]*([\d]+\s+\w+\s*\d{4})"),
-            "invoice_no": self._find(r"Invoice[:\s]*([A-Z]+/[A-Z0-9]+/\d+)"),
-            "service_month": self._find(r"Service Month\s*[:\s]*([^\n]+)"),
-            "lower_tds_cert_no": self._find(r"LOWER TDS CERT\.?\s*No\.?\s*[:\s]*([A-Z0-9]+)"),
+            "date": self._field("invoice_details.date"),
+            "invoice_no": self._field("invoice_details.invoice_no"),
+            "service_month": self._field("invoice_details.service_month"),
+            "lower_tds_cert_no": self._field("invoice_details.lower_tds_cert_no"),
         }
 
-    def _extract_resource_and_bill_details(self) -> list:
+    def iter_resource_and_bill_details(self) -> Iterator[dict]:
         """
-        Parse line-item rows from the table block.
-
-        Two observed PyMuPDF layouts for the same invoice format:
-
-        Layout A (bill_rate == taxable_value, full month):
-            1
-            SHAILENDRA KUSHWAH
-            998513
-            8000112642 51980.00     ← po_no + bill_rate share a line
-            ERCSIN01233612
-            51980.00
-            0.00 / 0.00 / 9356.40 / 61336.40
-
-        Layout B (bill_rate != taxable_value, partial month):
-            1
-            PRASHANT KUMAR
-            998513
-            8000111210              ← po_no alone
-            52189.00                ← bill_rate alone
-            ERCSMI00239725 1739.63  ← inv_code + taxable_value share a line
-            0.00 / 0.00 / 313.13 / 2052.76
-
-        Strategy: scan all lines after hsn_sac using type-based recognition,
-        never relying on fixed line positions.
+        Yield line-item rows one at a time with the configured engine.
+
+        Each row is emitted as soon as it is complete, so callers that
+        consume rows incrementally never hold the whole table in memory.
         """
-        table_block_match = re.search(
-            r"Total\s+INR\s*\n(.*?)Total\s+Invoice\s*Value",
-            self.text, re.IGNORECASE | re.DOTALL
-        )
-        if not table_block_match:
-            return []
-
-        block = table_block_match.group(1).strip()
-        rows = []
-
-        float_re   = re.compile(r"^\d[\d,]*\.\d{2}$")
-        int6_re    = re.compile(r"^\d{6}$")
-        int10_re   = re.compile(r"^\d{10}$")
-        invcode_re = re.compile(r"^[A-Z]{3,}[A-Z0-9]+$")
-
-        # Split records on lines that are a standalone serial number (1–3 digits)
-        record_splits = re.split(r"(?=^\d{1,3}\n)", block, flags=re.MULTILINE)
-
-        for record in record_splits:
-            record = record.strip()
-            if not record:
-                continue
-
-            lines = [l.strip() for l in record.splitlines() if l.strip()]
-            if len(lines) < 2:
-                continue
-
-            # Line 0: sl_no — must be 1–3 digit integer
-            if not re.fullmatch(r"\d{1,3}", lines[0]):
-                continue
-            sl_no = lines[0]
-
-            # Line 1: resource_name — all-caps words
-            resource_name = lines[1] if re.fullmatch(r"[A-Z][A-Z\s]+", lines[1]) else ""
-
-            # Line 2: hsn_sac — exactly 6 digits
-            hsn_sac = lines[2] if len(lines) > 2 and int6_re.fullmatch(lines[2]) else ""
-
-            # --- Scan remaining lines with type-based recognition ---
-            po_no = bill_rate = inv_code = ""
-            taxable = cgst = sgst = igst = total = ""
-            trailing_floats = []  # cgst, sgst, igst, total (always standalone)
-
-            i = 3
-            while i < len(lines):
-                line = lines[i]
-                parts = line.split()
-
-                # Pattern: "8000112642 51980.00" → po_no + bill_rate on one line (Layout A)
-                if (len(parts) == 2
-                        and int10_re.fullmatch(parts[0])
-                        and float_re.fullmatch(parts[1])
-                        and not po_no):
-                    po_no, bill_rate = parts[0], parts[1]
-
-                # Pattern: standalone 10-digit int → po_no alone (Layout B)
-                elif int10_re.fullmatch(line) and not po_no:
-                    po_no = line
-
-                # Pattern: standalone float immediately after po_no, before inv_code → bill_rate (Layout B)
-                elif float_re.fullmatch(line) and po_no and not bill_rate and not inv_code:
-                    bill_rate = line
-
-                # Pattern: "ERCSMI00239725 1739.63" → inv_code + taxable on one line (Layout B)
-                elif (len(parts) == 2
-                        and invcode_re.fullmatch(parts[0])
-                        and float_re.fullmatch(parts[1])
-                        and not inv_code):
-                    inv_code, taxable = parts[0], parts[1]
-
-                # Pattern: standalone invoice code (Layout A)
-                elif invcode_re.fullmatch(line) and not inv_code:
-                    inv_code = line
-
-                # Pattern: standalone float after inv_code → taxable then cgst/sgst/igst/total
-                elif float_re.fullmatch(line) and inv_code:
-                    if not taxable:
-                        taxable = line
-                    else:
-                        trailing_floats.append(line)
-
-                i += 1
-
-            cgst  = trailing_floats[0] if len(trailing_floats) > 0 else ""
-            sgst  = trailing_floats[1] if len(trailing_floats) > 1 else ""
-            igst  = trailing_floats[2] if len(trailing_floats) > 2 else ""
-            total = trailing_floats[3] if len(trailing_floats) > 3 else ""
-
-            rows.append({
-                "sl_no": sl_no,
-                "resource_name": resource_name,
-                "hsn_sac": hsn_sac,
-                "po_no": po_no,
-                "bill_rate": bill_rate,
-                "ericsson_invoice_code": inv_code,
-                "taxable_value": taxable,
-                "cgst": cgst,
-                "sgst": sgst,
-                "igst": igst,
-                "total_inr": total,
-            })
-
-        return rows
+        if self.engine == "layout":
+            yield from self._iter_table_by_layout()
+        else:
+            yield from self._iter_table_by_text()
+
+    def _iter_table_by_layout(self) -> Iterator[dict]:
+        """
+        Yield line-item rows from word geometry, page by page.
+
+        Columns and rows are resolved from word bounding boxes and the
+        table's ruling, so no assumptions about line breaks are needed.
+        Continuation pages reuse the previous page's columns when they do
+        not repeat the header row, and finish the row left open by the
+        page break before starting their own.
+        """
+        columns = open_row = None
+        for page_no in range(self.document.page_count):
+            parser = LayoutTableParser(
+                self.document.words(page_no),
+                self.document.drawings(page_no),
+                self.document.page(page_no).rect,
+                columns=columns,
+                open_row=open_row,
+            )
+            yield from parser.iter_rows()
+            columns, open_row = parser.columns, parser.open_row
+            if parser.ends_table:
+                break
+        if open_row is not None:
+            yield open_row  # The table ran to the last page without a totals row
+
+    def _iter_table_by_text(self) -> Iterator[dict]:
+        """
+        Yield line-item rows from the table text, stitched across pages.
+
+        Each page contributes the part of its table region after the header
+        row (if repeated) and before the totals row (if present). The table
+        starts on the first page with a header row and ends on the page with
+        the totals row; the pieces are joined and parsed as one block, so a
+        record broken by a page break is reassembled.
+        """
+        segments = []
+        for page_no in range(self.document.page_count):
+            rect = TABLE_REGION.resolve(self._page_anchors(page_no), self.document.page(page_no).rect)
+            text = self.document.clip_text(page_no, rect)
+
+            start = 0
+            header = TABLE_HEADER_RE.search(text)
+            if header:
+                start = header.end()
+            elif not segments:
+                continue  # The table has not started yet
+
+            end = TABLE_END_RE.search(text, start)
+            segments.append(text[start:end.start()] if end else text[start:])
+            if end:
+                break
+
+        yield from iter_line_items("\n".join(segments))
 
     def _extract_total_invoice_value(self) -> dict:
         # The totals line: Total Invoice Value <taxable> <cgst> <sgst> <igst> <total>
-        m = re.search(
-            r"Total Invoice\s*Value\s+"
-            r"([\d,]+\.\d{2})\s+"   # taxable_value
-            r"([\d,]+\.\d{2})\s+"   # cgst
-            r"([\d,]+\.\d{2})\s+"   # sgst
-            r"([\d,]+\.\d{2})\s+"   # igst
-            r"([\d,]+\.\d{2})",     # total_inr
-            self.text, re.IGNORECASE
-        )
-        in_words = self._find(
-            r"Total Invoice\s*Value\s*\(\s*In\s*Words\s*\)[:\s]*([^\n]+)"
-        )
+        m = self._fields["total_invoice_value"]
+        in_words = self._field("total_invoice_value.in_words")
 
         if m:
             return {
@@ -291,22 +645,22 @@ class PyMuPDFClient:
         """
         Extract NOTE points 1, 2, and the post script (GST contact line).
         """
-        note_block = self._find(r"NOTE:\s*(.*?)(?=Bank details)", )
+        note_block = self._field("note_block")
         note_1 = note_2 = post_script = ""
 
         if note_block:
             # Point 1 — starts with "1."
-            m1 = re.search(r"1\.\s*(.*?)(?=2\.)", note_block, re.DOTALL)
+            m1 = NOTE_POINT_1_RE.search(note_block)
             if m1:
-                note_1 = re.sub(r"\s+", " ", m1.group(1)).strip()
+                note_1 = WHITESPACE_RE.sub(" ", m1.group(1)).strip()
 
             # Point 2 — starts with "2." up to the GST contact line
-            m2 = re.search(r"2\.\s*(.*?)(?=For any kind|$)", note_block, re.DOTALL)
+            m2 = NOTE_POINT_2_RE.search(note_block)
             if m2:
-                note_2 = re.sub(r"\s+", " ", m2.group(1)).strip()
+                note_2 = WHITESPACE_RE.sub(" ", m2.group(1)).strip()
 
             # Post script — the GST contact line
-            mps = re.search(r"(For any kind of GST[^\n]+)", note_block)
+            mps = NOTE_POST_SCRIPT_RE.search(note_block)
             if mps:
                 post_script = mps.group(1).strip()
 
@@ -314,17 +668,15 @@ class PyMuPDFClient:
 
     def _extract_beneficiary_details(self) -> dict:
         return {
-            "beneficiary_name": self._find(
-                r"Beneficiary Name\s*[:\s]*([^\n]+(?:Limited)[^\n]*)"
-            ),
-            "bank_name": self._find(r"Bank\s*Name\s*[:\s]*([^\n]+)"),
-            "address": self._find(r"Address\s*[:\s]*([\d/A-Z\s]+ROAD)", ),
-            "reverse_charge": self._find(r"Reverse\s*Charge\s*[:\s]*(\w+)"),
-            "account_no": self._find(r"Account\s*Number\s*[:\s]*(\d+)"),
-            "ifsc_code": self._find(r"IFSC\s*Code\s*[:\s]*([A-Z0-9]+)"),
-            "micr_code": self._find(r"MICR\s*Code\s*[:\s]*(\d+)"),
-            "country": self._find(r"Country\s*[:\s]*(\w+)"),
-            "authorised_signatory": self._find(r"Authorised Signatory\s*:\s*([^\n]+)"),
+            "beneficiary_name": self._field("beneficiary_details.beneficiary_name"),
+            "bank_name": self._field("beneficiary_details.bank_name"),
+            "address": self._field("beneficiary_details.address"),
+            "reverse_charge": self._field("beneficiary_details.reverse_charge"),
+            "account_no": self._field("beneficiary_details.account_no"),
+            "ifsc_code": self._field("beneficiary_details.ifsc_code"),
+            "micr_code": self._field("beneficiary_details.micr_code"),
+            "country": self._field("beneficiary_details.country"),
+            "authorised_signatory": self._field("beneficiary_details.authorised_signatory"),
         }
 
     def _extract_qr_code(self) -> str:
@@ -332,7 +684,7 @@ class PyMuPDFClient:
         Detect QR code presence by checking for embedded images in the PDF.
         A more robust approach is to check image count; the invoice has a logo + QR.
         """
-        image_count = sum(len(page.get_images(full=True)) for page in self.doc)
+        image_count = self.document.image_count
         # Invoice has logo (1) + QR code (1) + digital sig (1) = typically 3+
         return "True" if image_count >= 2 else "False"
 
@@ -348,43 +700,53 @@ class PyMuPDFClient:
     # Public API
     # ------------------------------------------------------------------
 
-    def extract_invoice_data(self) -> dict:
+    def extract_invoice_data(self, stream: bool = False, timings: Optional[StageTimings] = None) -> dict:
         """
         Extract all invoice fields and return them as a structured dict
         matching the GeminiClient response schema.
 
+        Args:
+            stream (bool): If True, ``resource_and_bill_details`` is a lazy
+                iterator that parses rows as it is consumed, instead of a
+                list. Consume it before the document is closed.
+            timings (StageTimings, optional): Collects the time spent in
+                each section extractor, as ``extract.<section>``.
+
         Returns:
             dict: Fully populated invoice data dictionary.
         """
+        timed = (timings if timings is not None else StageTimings()).call
+        rows = self.iter_resource_and_bill_details()
         return {
-            "letter_head": self._extract_letter_head(),
-            "tax_invoice": self._extract_tax_invoice(),
-            "bill_to_details": self._extract_bill_to_details(),
-            "invoice_details": self._extract_invoice_details(),
-            "resource_and_bill_details": self._extract_resource_and_bill_details(),
-            "total_invoice_value": self._extract_total_invoice_value(),
-            "arn_for_lut": self._find(r"ARN[^\n]*[:\s]*([^\n]+)"),
-            "supply": self._find(r"(?<!Place of )(?<!Place Of )Supply\s*:\s*([^\n]+)"),
-            "igst_foregone": self._find(r"IGST\s*Foregone\s*[:\s]*([^\n]+)"),
-            "note": self._extract_note(),
-            "beneficiary_details": self._extract_beneficiary_details(),
-            "qr_code": self._extract_qr_code(),
-            "digital_signature": self._extract_digital_signature(),
+            "letter_head": timed("extract.letter_head", self._extract_letter_head),
+            "tax_invoice": timed("extract.tax_invoice", self._extract_tax_invoice),
+            "bill_to_details": timed("extract.bill_to_details", self._extract_bill_to_details),
+            "invoice_details": timed("extract.invoice_details", self._extract_invoice_details),
+            "resource_and_bill_details": rows if stream else timed("extract.resource_and_bill_details", list, rows),
+            "total_invoice_value": timed("extract.total_invoice_value", self._extract_total_invoice_value),
+            "arn_for_lut": self._field("arn_for_lut"),
+            "supply": self._field("supply"),
+            "igst_foregone": self._field("igst_foregone"),
+            "note": timed("extract.note", self._extract_note),
+            "beneficiary_details": timed("extract.beneficiary_details", self._extract_beneficiary_details),
+            "qr_code": timed("extract.qr_code", self._extract_qr_code),
+            "digital_signature": timed("extract.digital_signature", self._extract_digital_signature),
         }
 
 
-def pymupdf_client(pdf_path: str) -> dict:
+def pymupdf_client(pdf_path: str, engine: str = "text") -> dict:
     """
     Convenience wrapper — mirrors the gemini_client() function signature.
 
     Args:
         pdf_path (str): Path to the invoice PDF.
+        engine (str): Table extraction engine, "text" or "layout".
 
     Returns:
         dict: Extracted invoice data in the GeminiClient schema.
     """
-    client = PyMuPDFClient(pdf_path)
-    return client.extract_invoice_data()
+    with PyMuPDFClient(pdf_path, engine=engine) as client:
+        return client.extract_invoice_data()
 
 
 # ------------------------------------------------------------------
@@ -394,8 +756,8 @@ if __name__ == "__main__":
     import sys
 
     if len(sys.argv) < 2:
-        print("Usage: python pymupdf_client.py <path_to_invoice.pdf>")
+        print("Usage: python pymupdf_client.py <path_to_invoice.pdf> [text|layout]")
         sys.exit(1)
 
-    result = pymupdf_client(sys.argv[1])
+    result = pymupdf_client(sys.argv[1], *sys.argv[2:3])
     print(json.dumps(result, indent=2, ensure_ascii=False))
\ No newline at end of file
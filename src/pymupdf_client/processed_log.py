@@ -0,0 +1,332 @@
+"""
+Processed Log Module
+
+Records the outcome of every GSPPI invoice in a SQLite database, keyed by
+BillID. The database runs in WAL mode, so:
+
+- recording an outcome is a single-row upsert, however long the log grows;
+- readers never block the writer, and writers from several uvicorn worker
+  processes queue on SQLite's file lock (waiting up to
+  PROCESSED_LOG_BUSY_TIMEOUT seconds) instead of overwriting each other;
+- lookups by status and processing date use indexes.
+
+Successful entries also keep what is needed to skip an unchanged invoice
+on the next poll: the SHA-256 of the PDF, the server's ETag and
+Last-Modified headers, and the result that was returned for it.
+
+An existing JSON log (PROCESSED_LOG_PATH, the previous format) is imported
+on first use and renamed to ``<name>.migrated``.
+
+Configuration (environment):
+    PROCESSED_LOG_DB            Database path (default processed_invoices.db).
+    PROCESSED_LOG_PATH          Legacy JSON log to import (default
+                                processed_invoices.json).
+    PROCESSED_LOG_BUSY_TIMEOUT  Seconds to wait for another writer (default 10).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+
+PROCESSED_LOG_DB = os.getenv("PROCESSED_LOG_DB", "processed_invoices.db")
+PROCESSED_LOG_PATH = os.getenv("PROCESSED_LOG_PATH", "processed_invoices.json")
+PROCESSED_LOG_BUSY_TIMEOUT = float(os.getenv("PROCESSED_LOG_BUSY_TIMEOUT", "10"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_invoices (
+    bill_id       TEXT PRIMARY KEY,
+    status        TEXT NOT NULL,
+    url           TEXT NOT NULL DEFAULT '',
+    doc_type      TEXT NOT NULL DEFAULT '',
+    error         TEXT,
+    processed_at  TEXT NOT NULL,
+    content_hash  TEXT,
+    etag          TEXT,
+    last_modified TEXT,
+    result        TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_processed_status_date
+    ON processed_invoices (status, processed_at);
+CREATE INDEX IF NOT EXISTS idx_processed_date
+    ON processed_invoices (processed_at);
+CREATE TABLE IF NOT EXISTS log_migrations (
+    source      TEXT PRIMARY KEY,
+    migrated_at TEXT NOT NULL
+);
+"""
+
+COLUMNS = "bill_id, status, url, doc_type, error, processed_at"
+
+# Columns added after the first release, with their types
+SKIP_COLUMNS = {
+    "content_hash": "TEXT",
+    "etag": "TEXT",
+    "last_modified": "TEXT",
+    "result": "TEXT",
+}
+
+UPSERT = f"""
+INSERT INTO processed_invoices ({COLUMNS}, {", ".join(SKIP_COLUMNS)})
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (bill_id) DO UPDATE SET
+    status = excluded.status,
+    url = excluded.url,
+    doc_type = excluded.doc_type,
+    error = excluded.error,
+    processed_at = excluded.processed_at,
+    content_hash = excluded.content_hash,
+    etag = excluded.etag,
+    last_modified = excluded.last_modified,
+    result = excluded.result
+"""
+
+
+def _entry(row) -> dict:
+    """Convert a row to the JSON log's entry format."""
+    entry = {
+        "processed_at": row["processed_at"],
+        "status": row["status"],
+        "url": row["url"],
+        "doc_type": row["doc_type"],
+    }
+    if row["error"] is not None:
+        entry["error"] = row["error"]
+    return entry
+
+
+class ProcessedLog:
+    """
+    SQLite-backed log of processed invoices.
+
+    Each thread gets its own connection (SQLite connections must not be
+    shared across threads), and a forked child opens fresh ones.
+    """
+
+    def __init__(self, path: str = PROCESSED_LOG_DB, legacy_path: Optional[str] = PROCESSED_LOG_PATH):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._local = threading.local()
+        self._pid = None
+        self._init_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Connections
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            with self._init_lock:
+                if self._pid != os.getpid():
+                    self._local = threading.local()
+                    self._initialise()
+                    self._pid = os.getpid()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        # Autocommit mode: each statement commits on its own, and
+        # multi-statement transactions are opened explicitly
+        conn = sqlite3.connect(self.path, timeout=PROCESSED_LOG_BUSY_TIMEOUT, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Durable across application crashes; only an OS crash can lose
+        # the last commits, which the next batch simply rewrites
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _initialise(self):
+        """Create the schema and import the legacy JSON log, once."""
+        conn = self._open()
+        try:
+            conn.executescript(SCHEMA)
+            self._add_missing_columns(conn)
+            if self.legacy_path and os.path.exists(self.legacy_path):
+                self._migrate_json(conn, self.legacy_path)
+        finally:
+            conn.close()
+
+    def _add_missing_columns(self, conn: sqlite3.Connection):
+        """Upgrade a database created before SKIP_COLUMNS existed."""
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(processed_invoices)")}
+        for name, sql_type in SKIP_COLUMNS.items():
+            if name not in existing:
+                try:
+                    conn.execute(f"ALTER TABLE processed_invoices ADD COLUMN {name} {sql_type}")
+                except sqlite3.OperationalError:
+                    pass  # Another worker added it first
+
+    def _migrate_json(self, conn: sqlite3.Connection, json_path: str):
+        source = os.path.abspath(json_path)
+
+        with open(json_path, "r", encoding="utf-8") as f:
+            content = f.read().strip()
+        legacy = json.loads(content) if content else {}
+
+        # BEGIN IMMEDIATE takes the write lock up front, so when several
+        # workers start together exactly one of them imports the file
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT 1 FROM log_migrations WHERE source = ?", (source,)).fetchone()
+            if not done:
+                # Entries recorded since the switch are newer; keep them
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO processed_invoices ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            bill_id,
+                            entry.get("status", ""),
+                            entry.get("url", ""),
+                            entry.get("doc_type", ""),
+                            entry.get("error"),
+                            entry.get("processed_at", ""),
+                        )
+                        for bill_id, entry in legacy.items()
+                    ],
+                )
+                conn.execute(
+                    "INSERT INTO log_migrations (source, migrated_at) VALUES (?, ?)",
+                    (source, datetime.now(timezone.utc).isoformat()),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        try:
+            os.replace(json_path, json_path + ".migrated")
+        except OSError:
+            pass  # Another worker renamed it first
+
+    def close(self):
+        """Close this thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def upsert(self, bill_id: str, status: str, url: str = "", doc_type: str = "", error: Optional[str] = None,
+               content_hash: Optional[str] = None, etag: Optional[str] = None,
+               last_modified: Optional[str] = None, result: Optional[dict] = None):
+        """
+        Record the latest outcome for *bill_id*, replacing any earlier one.
+
+        Args:
+            content_hash, etag, last_modified (str, optional): Identify the
+                PDF that was processed, for skipping it when unchanged.
+            result (dict, optional): The batch result to return for it then.
+
+        Raises:
+            sqlite3.OperationalError: If the database stays locked for
+                longer than PROCESSED_LOG_BUSY_TIMEOUT.
+        """
+        processed_at = datetime.now(timezone.utc).isoformat()
+        self._connect().execute(UPSERT, (
+            bill_id, status, url or "", doc_type or "", error, processed_at,
+            content_hash, etag, last_modified,
+            json.dumps(result, ensure_ascii=False) if result is not None else None,
+        ))
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get(self, bill_id: str) -> Optional[dict]:
+        """Return the entry for *bill_id*, or None if it was never processed."""
+        row = self._connect().execute(
+            f"SELECT {COLUMNS} FROM processed_invoices WHERE bill_id = ?", (bill_id,)
+        ).fetchone()
+        return _entry(row) if row else None
+
+    def get_unchanged_candidate(self, bill_id: str, url: str) -> Optional[dict]:
+        """
+        Return what is needed to skip *bill_id* if its PDF is unchanged.
+
+        Only a successful entry for the same URL with a stored result
+        qualifies.
+
+        Returns:
+            dict | None: content_hash, etag, last_modified and result.
+        """
+        row = self._connect().execute(
+            "SELECT content_hash, etag, last_modified, result FROM processed_invoices "
+            "WHERE bill_id = ? AND url = ? AND status = 'success' AND result IS NOT NULL",
+            (bill_id, url),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "content_hash": row["content_hash"],
+            "etag": row["etag"],
+            "last_modified": row["last_modified"],
+            "result": json.loads(row["result"]),
+        }
+
+    def all(self) -> Dict[str, dict]:
+        """Return every entry keyed by BillID, in the JSON log's format."""
+        rows = self._connect().execute(f"SELECT {COLUMNS} FROM processed_invoices")
+        return {row["bill_id"]: _entry(row) for row in rows}
+
+    def find(self, status: Optional[str] = None, since: Optional[str] = None,
+             until: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        """
+        Look entries up by status and/or processing date (both indexed).
+
+        Args:
+            status (str, optional): 'success' or 'failed'.
+            since (str, optional): ISO-8601 timestamp, inclusive.
+            until (str, optional): ISO-8601 timestamp, exclusive.
+            limit (int, optional): Maximum number of entries.
+
+        Returns:
+            list: Entries, newest first, each with its 'bill_id' added.
+        """
+        clauses, params = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if since is not None:
+            clauses.append("processed_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("processed_at < ?")
+            params.append(until)
+
+        sql = f"SELECT {COLUMNS} FROM processed_invoices"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY processed_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        return [{"bill_id": row["bill_id"], **_entry(row)} for row in self._connect().execute(sql, params)]
+
+    def counts(self) -> Dict[str, int]:
+        """Return the number of entries per status."""
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM processed_invoices GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+
+_processed_log = None
+_processed_log_lock = threading.Lock()
+
+
+def get_processed_log() -> ProcessedLog:
+    """Return the shared ProcessedLog for PROCESSED_LOG_DB."""
+    global _processed_log
+    with _processed_log_lock:
+        if _processed_log is None:
+            _processed_log = ProcessedLog()
+        return _processed_log
@@ -12,6 +12,11 @@ from typing import Dict, List
 from helper import is_value_present, number_to_words_inr
 
 
+# Bump whenever a change alters validation results; cached results are
+# keyed by it (see result_cache)
+VALIDATOR_VERSION = "1"
+
+
 class ValidationConstants:
     """
     Constants used for invoice validation including regex patterns and expected values.
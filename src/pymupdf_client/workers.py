@@ -0,0 +1,289 @@
+"""
+Executor Module
+
+Runs the CPU-bound invoice stages (opening and parsing the PDF, rendering,
+extraction) off the asyncio event loop, so one slow invoice no longer stalls
+every other request on the same uvicorn worker.
+
+Configuration (environment):
+    EXECUTOR_KIND     "process" (default) or "thread". Processes sidestep the
+                      GIL for parsing and rendering; threads only help stages
+                      that release it (network calls, file I/O).
+    EXECUTOR_WORKERS  Pool size (default: number of CPUs).
+    EXECUTOR_PRESTART Start every worker at application startup, and run
+                      the worker initializer (see set_worker_initializer)
+                      in each, instead of on the first jobs (default true).
+    EXECUTOR_WARM_UP_TIMEOUT
+                      Seconds wait_for_workers waits for the workers to be
+                      ready (default 120).
+
+Functions submitted to a process pool must be module-level and take and
+return picklable values (bytes, paths, dicts), never open documents or
+FastAPI objects.
+
+Throughput statistics are collected for the /health endpoint.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+
+EXECUTOR_KIND = os.getenv("EXECUTOR_KIND", "process")
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", str(os.cpu_count() or 1)))
+EXECUTOR_PRESTART = os.getenv("EXECUTOR_PRESTART", "true").lower() in ("1", "true", "yes")
+EXECUTOR_WARM_UP_TIMEOUT = float(os.getenv("EXECUTOR_WARM_UP_TIMEOUT", "120"))
+
+# Completed jobs remembered for the rolling throughput figure
+STATS_WINDOW_SECONDS = 60.0
+
+
+class ExecutorStats:
+    """
+    Job counters plus a rolling window of recently completed jobs.
+
+    All methods are safe to call from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._recent = deque()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def job_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def job_finished(self, duration: float, ok: bool):
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self.busy_seconds += duration
+            self._recent.append(now)
+            self._trim(now)
+
+    def _trim(self, now: float):
+        while self._recent and now - self._recent[0] > STATS_WINDOW_SECONDS:
+            self._recent.popleft()
+
+    def snapshot(self) -> dict:
+        """
+        Return the current figures.
+
+        Returns:
+            dict: in_flight, completed, failed, avg_latency_ms, and
+            throughput_per_sec over the last STATS_WINDOW_SECONDS (or the
+            uptime, if shorter).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            finished = self.completed + self.failed
+            window = min(STATS_WINDOW_SECONDS, now - self._started_at) or 1.0
+            return {
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_latency_ms": round(self.busy_seconds / finished * 1000, 2) if finished else 0.0,
+                "throughput_per_sec": round(len(self._recent) / window, 3),
+                "window_seconds": round(window, 1),
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+stats = ExecutorStats()
+
+# Run in each worker as it starts, and released by it once that is done
+_worker_initializer = None
+_workers_ready = None
+
+# Set by start_executor for wait_for_workers
+_prestart = None
+
+# Seconds from start_executor until every worker was ready
+_warm_up_seconds = None
+
+
+def set_worker_initializer(func):
+    """
+    Run ``func()`` in every executor worker as it starts, before its first
+    job; e.g. to warm it up. Must be module-level for a process pool.
+    Applies to executors created after the call.
+    """
+    global _worker_initializer
+    _worker_initializer = func
+
+
+def _init_worker(initializer, ready):
+    # A failed warm-up must not break the pool; the worker still works
+    try:
+        if initializer is not None:
+            initializer()
+    except Exception as e:
+        print(f"Warning: Executor worker initializer failed: {e}")
+    finally:
+        ready.release()
+
+
+def _noop():
+    return None
+
+
+def _hold(barrier):
+    # Keep this thread busy until every worker has a job of its own
+    barrier.wait()
+
+
+def get_executor() -> Executor:
+    """Return the shared executor, creating it on first use."""
+    global _executor, _workers_ready
+    with _executor_lock:
+        if _executor is None:
+            if EXECUTOR_KIND == "process":
+                _workers_ready = multiprocessing.Semaphore(0)
+                _executor = ProcessPoolExecutor(
+                    max_workers=EXECUTOR_WORKERS,
+                    initializer=_init_worker,
+                    initargs=(_worker_initializer, _workers_ready),
+                )
+            elif EXECUTOR_KIND == "thread":
+                _workers_ready = threading.Semaphore(0)
+                _executor = ThreadPoolExecutor(
+                    max_workers=EXECUTOR_WORKERS,
+                    thread_name_prefix="invoice",
+                    initializer=_init_worker,
+                    initargs=(_worker_initializer, _workers_ready),
+                )
+            else:
+                raise ValueError(f"Unknown EXECUTOR_KIND '{EXECUTOR_KIND}'. Expected 'process' or 'thread'.")
+        return _executor
+
+
+def start_executor():
+    """
+    Create the executor and start all its workers now, instead of on the
+    first jobs; each runs the worker initializer before taking any work.
+
+    Returns at once; wait_for_workers waits until they are ready. Call it
+    before the application starts other threads: a fork-based pool copies
+    the process as it is, and a lock another thread holds at that moment
+    stays locked forever in the workers. They inherit every module
+    imported by then.
+    """
+    global _prestart
+    start = time.perf_counter()
+    executor = get_executor()
+    barrier = None
+    if EXECUTOR_KIND == "thread":
+        # A thread pool starts a thread per job only while none is idle, and
+        # one that finished its job already is; so no job may finish before
+        # they have all started
+        barrier = threading.Barrier(EXECUTOR_WORKERS, timeout=EXECUTOR_WARM_UP_TIMEOUT)
+        futures = [executor.submit(_hold, barrier) for _ in range(EXECUTOR_WORKERS)]
+    else:
+        # A fork-based process pool starts every worker on its first job
+        futures = [executor.submit(_noop) for _ in range(EXECUTOR_WORKERS)]
+    _prestart = (executor, _workers_ready, futures, start, barrier)
+
+
+def wait_for_workers(timeout: float = EXECUTOR_WARM_UP_TIMEOUT) -> float:
+    """
+    Wait until every worker started by start_executor has run the worker
+    initializer.
+
+    Blocks; call it through ``asyncio.to_thread`` from async code.
+
+    Returns:
+        float: Seconds since start_executor was called.
+
+    Raises:
+        TimeoutError: If the workers are not ready within *timeout* seconds.
+        RuntimeError: If the executor is shut down meanwhile.
+    """
+    global _warm_up_seconds
+    executor, ready, futures, start, barrier = _prestart
+    deadline = time.perf_counter() + timeout
+    waiting = len(futures)
+    try:
+        while waiting:
+            # Wake up regularly, so a pool shut down or broken meanwhile does
+            # not leave this thread waiting out the whole timeout
+            if ready.acquire(timeout=0.1):
+                waiting -= 1
+                continue
+            if _executor is not executor:
+                raise RuntimeError("Executor was shut down before its workers were ready")
+            for future in futures:
+                if future.done() and not future.cancelled() and future.exception() is not None:
+                    raise future.exception()
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"Executor workers not ready after {timeout:g}s")
+        for future in futures:
+            future.result()
+    except BaseException:
+        # Free the threads still held by start_executor
+        if barrier is not None:
+            barrier.abort()
+        raise
+
+    _warm_up_seconds = time.perf_counter() - start
+    return _warm_up_seconds
+
+
+def shutdown_executor():
+    """Shut the shared executor down (called on application shutdown)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` on the shared executor and await its result.
+
+    A process pool that broke (e.g. a worker was killed) is discarded, so
+    the next call starts a fresh one.
+
+    Raises:
+        Whatever *func* raises, or BrokenProcessPool if its worker died.
+    """
+    loop = asyncio.get_running_loop()
+    stats.job_started()
+    start = time.perf_counter()
+    ok = False
+    try:
+        result = await loop.run_in_executor(get_executor(), partial(func, *args, **kwargs))
+        ok = True
+        return result
+    except BrokenProcessPool:
+        shutdown_executor()
+        raise
+    finally:
+        stats.job_finished(time.perf_counter() - start, ok)
+
+
+def executor_info() -> dict:
+    """Executor configuration and throughput figures for /health."""
+    return {
+        "kind": EXECUTOR_KIND,
+        "workers": EXECUTOR_WORKERS,
+        "warm_up_seconds": round(_warm_up_seconds, 3) if _warm_up_seconds is not None else None,
+        **stats.snapshot(),
+    }